@@ -10,6 +10,14 @@ HUGGING_FACE_MODEL_NAME = "google/vit-base-patch16-224-in21k" # A common ViT mod
 
 IMAGE_SIZE = (224, 224) # Standard input size for many ViT models
 
+BATCH_SIZE_ETL = 32 # Number of images per ViT forward pass in FashionTagger.get_metadata_batch
+DECODE_WORKERS = 4 # Threads decoding images / extracting colors while the model runs
+USE_TORCH_COMPILE = True # Compile the ViT with torch.compile (slower startup, faster inference)
+USE_ONNX_RUNTIME_CPU = True # Without CUDA, run an int8-quantized ONNX export when onnxruntime is installed
+ONNX_CACHE_DIR = "./.onnx_cache" # Where the exported/quantized ONNX models are stored
+
+VIT_CACHE_PATH = "./.vit_cache" # shelve file caching ViT predictions by image content hash
+PHASH_MAX_DISTANCE = 4 # Reuse predicted labels of images whose perceptual hashes differ by at most this many bits (None disables)
+
 # Placeholder for potential future configurations
-# E.g., BATCH_SIZE_ETL = 8
 # E.g., MODEL_CONFIDENCE_THRESHOLD = 0.5
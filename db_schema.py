@@ -0,0 +1,25 @@
+from pathlib import Path
+
+# Tables created by schema.sql; when all exist, the DDL is not sent at all
+SCHEMA_TABLES = ["image_metadata", "image_navigation_paths", "user_interactions", "recommendations"]
+
+def read_sql_file(filename):
+    """Reads an SQL file located next to this module; returns None if it is missing (reported when it is needed)."""
+    try:
+        return (Path(__file__).parent / filename).read_bytes()
+    except FileNotFoundError:
+        return None
+
+# Read once at import, so every caller (including pooled worker threads) shares the same bytes
+SCHEMA_SQL = read_sql_file("schema.sql")
+
+def ensure_schema(cur):
+    """
+    Runs schema.sql on the cursor unless every table in SCHEMA_TABLES already exists.
+    Raises FileNotFoundError if the tables are missing and so is schema.sql.
+    """
+    cur.execute("SELECT bool_and(to_regclass(t) IS NOT NULL) FROM unnest(%s::text[]) AS t;", (SCHEMA_TABLES,))
+    if not cur.fetchone()[0]:
+        if SCHEMA_SQL is None:
+            raise FileNotFoundError(f"schema.sql not found in {Path(__file__).parent}")
+        cur.execute(SCHEMA_SQL)
@@ -1,7 +1,11 @@
-import glob
+import csv
+import io
 import os
+import queue
+import threading
 import psycopg2
-from psycopg2 import sql
+from psycopg2.extras import execute_values
+from db_schema import ensure_schema
 
 # Attempt to import FashionTagger and config
 try:
@@ -14,6 +18,30 @@ except ImportError:
 # config.py is primarily used by fashion_tagger.py, direct imports not strictly needed here
 # unless ETL specific configurations were to be added to config.py.
 
+# Column order of the rows sent to image_metadata
+METADATA_COLUMNS = ("image_id", "file_path", "description", "dominant_colors",
+                    "style_tags", "garment_type", "accessories", "gender", "season")
+INSERT_BATCH_SIZE = 256 # Number of tagged images buffered before they are flushed to the database
+WRITER_QUEUE_SIZE = 64 # Max rows waiting for the background database writer
+
+# ETL_ASYNC_COMMIT=1 makes batch commits return without waiting for the WAL flush. A server
+# crash can lose the last few committed batches; rerunning the (idempotent) ETL restores them.
+ETL_ASYNC_COMMIT = os.environ.get("ETL_ASYNC_COMMIT", "0") == "1"
+
+# Shared by every image_metadata write path: re-tagged images overwrite their previous metadata
+UPSERT_CONFLICT_CLAUSE = """
+        ON CONFLICT (image_id) DO UPDATE SET
+            file_path = EXCLUDED.file_path,
+            description = EXCLUDED.description,
+            dominant_colors = EXCLUDED.dominant_colors,
+            style_tags = EXCLUDED.style_tags,
+            garment_type = EXCLUDED.garment_type,
+            accessories = EXCLUDED.accessories,
+            gender = EXCLUDED.gender,
+            season = EXCLUDED.season,
+            created_at = now();
+"""
+
 def get_db_connection():
     """Establishes a connection to the PostgreSQL database."""
     try:
@@ -33,67 +61,221 @@ def get_db_connection():
 def create_table_if_not_exists(conn):
     """Creates the image_metadata table from schema.sql if it doesn't exist."""
     # This function will also create other tables defined in schema.sql if they are not present.
+    # The DDL runs in autocommit mode so it never shares a transaction with the metadata inserts.
+    previous_autocommit = conn.autocommit
     try:
-        with open("schema.sql", "r") as f:
-            schema_sql = f.read()
+        conn.autocommit = True
         with conn.cursor() as cur:
-            cur.execute(schema_sql)
-        conn.commit()
+            ensure_schema(cur)
         print("Tables from schema.sql checked/created successfully.")
     except (FileNotFoundError) as e:
         print(f"Error: schema.sql not found. {e}")
         return False
     except (psycopg2.Error) as e:
         print(f"Error creating tables from schema.sql: {e}")
-        conn.rollback() # Rollback in case of error during table creation
         return False
+    finally:
+        conn.autocommit = previous_autocommit
     return True
 
-def insert_metadata_to_db(conn, metadata_dict):
-    """Inserts image metadata into the image_metadata table."""
+def metadata_to_row(metadata_dict):
+    """Converts a metadata dictionary from FashionTagger into a tuple ordered as METADATA_COLUMNS."""
     # Ensure all required keys are present, using defaults from FashionTagger if any were missing
     # The FashionTagger.get_metadata should always return the full structure.
-    required_keys = ["image_id", "file_path", "description", "dominant_colors", 
-                     "style_tags", "garment_type", "accessories", "gender", "season"]
-    for key in required_keys:
+    for key in METADATA_COLUMNS:
         if key not in metadata_dict:
             print(f"Warning: Key '{key}' missing from metadata for {metadata_dict.get('image_id', 'Unknown Image')}. Using default.")
             if key.endswith("s"): # for list types like dominant_colors, style_tags, accessories
                 metadata_dict[key] = [] 
             else:
                 metadata_dict[key] = "unknown"
+    return tuple(metadata_dict[key] for key in METADATA_COLUMNS)
+
+def insert_metadata_to_db(conn, metadata_rows):
+    """
+    Inserts a batch of image metadata rows into the image_metadata table.
 
+    The rows are sent with execute_values, which expands them into multi-row
+    INSERT statements (page_size rows per round trip) instead of one statement per image.
+    """
+    if not metadata_rows:
+        return True
 
-    insert_query = sql.SQL("""
+    insert_query = """
         INSERT INTO image_metadata (
             image_id, file_path, description, dominant_colors, 
             style_tags, garment_type, accessories, gender, season
-        ) VALUES (
-            %(image_id)s, %(file_path)s, %(description)s, %(dominant_colors)s,
-            %(style_tags)s, %(garment_type)s, %(accessories)s, %(gender)s, %(season)s
-        ) ON CONFLICT (image_id) DO UPDATE SET
-            file_path = EXCLUDED.file_path,
-            description = EXCLUDED.description,
-            dominant_colors = EXCLUDED.dominant_colors,
-            style_tags = EXCLUDED.style_tags,
-            garment_type = EXCLUDED.garment_type,
-            accessories = EXCLUDED.accessories,
-            gender = EXCLUDED.gender,
-            season = EXCLUDED.season,
-            created_at = now();
-    """)
+        ) VALUES %s
+    """ + UPSERT_CONFLICT_CLAUSE
     try:
         with conn.cursor() as cur:
-            cur.execute(insert_query, metadata_dict)
+            execute_values(cur, insert_query, metadata_rows,
+                           template="(%s, %s, %s, %s, %s, %s, %s, %s, %s)", page_size=500)
         return True
     except psycopg2.Error as e:
-        print(f"Database Error inserting metadata for {metadata_dict.get('image_id', 'Unknown image')}: {e}")
+        print(f"Database Error inserting metadata batch of {len(metadata_rows)} images: {e}")
         return False
     except Exception as e:
-        print(f"General Error inserting metadata for {metadata_dict.get('image_id', 'Unknown image')}: {e}")
+        print(f"General Error inserting metadata batch of {len(metadata_rows)} images: {e}")
         return False
 
 
+def _pg_array_literal(values):
+    """Serializes a list of strings as a PostgreSQL array literal, e.g. {"a","b"}."""
+    quoted = ('"' + str(v).replace('\\', '\\\\').replace('"', '\\"') + '"' for v in values)
+    return "{" + ",".join(quoted) + "}"
+
+def enable_async_commit(conn):
+    """Turns off synchronous_commit for this session so bulk-load commits skip the WAL flush wait."""
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SET synchronous_commit TO OFF;")
+        conn.commit()
+        print("ETL_ASYNC_COMMIT=1: batch commits will not wait for the WAL flush.")
+    except psycopg2.Error as e:
+        print(f"Warning: Could not disable synchronous_commit: {e}")
+        conn.rollback()
+
+def image_metadata_is_empty(conn):
+    """Returns True if image_metadata has no rows yet (first-time population)."""
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT NOT EXISTS (SELECT 1 FROM image_metadata);")
+            return cur.fetchone()[0]
+    except psycopg2.Error as e:
+        print(f"Error checking image_metadata contents: {e}")
+        conn.rollback()
+        return False
+
+def copy_metadata_to_db(conn, metadata_rows):
+    """
+    Bulk loads a batch of image metadata rows using COPY ... FROM STDIN.
+
+    Rows are streamed as CSV into a temporary staging table and then upserted into
+    image_metadata with a single INSERT ... SELECT, so existing images are still updated.
+    This avoids the per-row parse/bind work of INSERT and is used for first-time loads.
+    """
+    if not metadata_rows:
+        return True
+
+    buf = io.StringIO()
+    writer = csv.writer(buf, quoting=csv.QUOTE_MINIMAL)
+    for row in metadata_rows:
+        writer.writerow([_pg_array_literal(value) if isinstance(value, (list, tuple)) else value
+                         for value in row])
+    buf.seek(0)
+
+    columns = ", ".join(METADATA_COLUMNS)
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                CREATE TEMP TABLE IF NOT EXISTS image_metadata_stage
+                (LIKE image_metadata INCLUDING DEFAULTS) ON COMMIT DROP;
+            """)
+            cur.copy_expert(f"COPY image_metadata_stage ({columns}) FROM STDIN WITH CSV", buf)
+            cur.execute(f"""
+                INSERT INTO image_metadata ({columns})
+                SELECT {columns} FROM image_metadata_stage
+            """ + UPSERT_CONFLICT_CLAUSE)
+            cur.execute("TRUNCATE image_metadata_stage;")
+        return True
+    except psycopg2.Error as e:
+        print(f"Database Error copying metadata batch of {len(metadata_rows)} images: {e}")
+        return False
+
+
+def insert_metadata_rows_prepared(conn, metadata_rows):
+    """
+    Inserts metadata rows one at a time through a server-side prepared statement.
+
+    Used to salvage a batch that failed as a whole: the upsert is parsed and planned once
+    (PREPARE ins_meta) and each row only pays for EXECUTE. Every row runs under its own
+    savepoint so a bad row is skipped without aborting the others.
+
+    Returns:
+        tuple: (number of rows written, list of image_ids that failed)
+    """
+    written = 0
+    failed_ids = []
+    placeholders = ", ".join(f"${i}" for i in range(1, len(METADATA_COLUMNS) + 1))
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1 FROM pg_prepared_statements WHERE name = 'ins_meta';")
+            if cur.fetchone() is None:
+                cur.execute(f"""
+                    PREPARE ins_meta AS
+                    INSERT INTO image_metadata ({", ".join(METADATA_COLUMNS)}) VALUES ({placeholders})
+                """ + UPSERT_CONFLICT_CLAUSE)
+            execute_query = f"EXECUTE ins_meta ({', '.join(['%s'] * len(METADATA_COLUMNS))});"
+            for row in metadata_rows:
+                cur.execute("SAVEPOINT ins_meta_row;")
+                try:
+                    cur.execute(execute_query, row)
+                    cur.execute("RELEASE SAVEPOINT ins_meta_row;")
+                    written += 1
+                except psycopg2.Error as e:
+                    print(f"Database Error inserting metadata for {row[0]}: {e}")
+                    cur.execute("ROLLBACK TO SAVEPOINT ins_meta_row;")
+                    failed_ids.append(row[0])
+    except psycopg2.Error as e:
+        print(f"Database Error preparing metadata insert: {e}")
+        return written, failed_ids + [row[0] for row in metadata_rows[written + len(failed_ids):]]
+    return written, failed_ids
+
+def list_image_files(image_dir):
+    """Returns the sorted paths of the img_*.jpg files in image_dir, using a single os.scandir pass."""
+    try:
+        with os.scandir(image_dir) as entries:
+            return sorted(entry.path for entry in entries
+                          if entry.name.startswith("img_") and entry.name.endswith(".jpg") and entry.is_file())
+    except FileNotFoundError:
+        return []
+
+def write_metadata_rows(conn, write_batch, metadata_rows):
+    """
+    Writes one batch with write_batch as its own transaction.
+
+    If the batch fails, it is rolled back to a savepoint and retried row by row, so
+    earlier batches and the good rows of this batch are kept and committed.
+
+    Returns:
+        tuple: (number of rows written, number of rows that failed)
+    """
+    with conn: # Commits the batch on exit (rolls back only on an unexpected exception)
+        with conn.cursor() as cur:
+            cur.execute("SAVEPOINT metadata_batch;")
+        if write_batch(conn, metadata_rows):
+            print(f"Saved metadata batch of {len(metadata_rows)} images.")
+            return len(metadata_rows), 0
+        # Error already printed by write_batch; retry the batch row by row to isolate bad rows
+        with conn.cursor() as cur:
+            cur.execute("ROLLBACK TO SAVEPOINT metadata_batch;")
+        written, failed_ids = insert_metadata_rows_prepared(conn, metadata_rows)
+        print(f"Saved {written} images of the failed batch individually; {len(failed_ids)} failed.")
+        return written, len(failed_ids)
+
+def _db_writer(conn, row_queue, write_batch, stats):
+    """
+    Background writer: drains metadata rows from row_queue and writes them every
+    INSERT_BATCH_SIZE rows, until the None sentinel arrives. Counts go into stats.
+    """
+    pending_rows = []
+    while True:
+        row = row_queue.get()
+        if row is not None:
+            pending_rows.append(row)
+        if pending_rows and (row is None or len(pending_rows) >= INSERT_BATCH_SIZE):
+            try:
+                written, failed = write_metadata_rows(conn, write_batch, pending_rows)
+            except Exception as e:
+                print(f"Critical error writing metadata batch of {len(pending_rows)} images: {e}")
+                written, failed = 0, len(pending_rows)
+            stats["inserted"] += written
+            stats["errors"] += failed
+            pending_rows = []
+        if row is None:
+            return
+
 def process_images_and_store_metadata(fashion_tagger_instance):
     """
     Uses FashionTagger to get metadata for images and stores it in PostgreSQL.
@@ -107,7 +289,7 @@ def process_images_and_store_metadata(fashion_tagger_instance):
         conn.close()
         return
 
-    image_files = glob.glob("./images/img_*.jpg")
+    image_files = list_image_files("./images")
     if not image_files:
         print("No images found in the ./images directory (e.g., ./images/img_*.jpg).")
         conn.close()
@@ -115,47 +297,58 @@ def process_images_and_store_metadata(fashion_tagger_instance):
     
     print(f"Found {len(image_files)} images to process.")
 
-    inserted_count = 0
+    if ETL_ASYNC_COMMIT:
+        enable_async_commit(conn)
+
+    # On a first-time load every row is an insert, so stream batches through COPY.
+    if image_metadata_is_empty(conn):
+        print("image_metadata is empty: using COPY for the initial bulk load.")
+        write_batch = copy_metadata_to_db
+    else:
+        write_batch = insert_metadata_to_db
+
     error_count = 0
     processed_count = 0
 
-    for img_path in sorted(image_files):
-        processed_count +=1
-        print(f"\nProcessing image ({processed_count}/{len(image_files)}): {img_path}")
-        try:
-            metadata = fashion_tagger_instance.get_metadata(img_path)
-            if metadata is None: # FashionTagger.get_metadata can return None on critical error for that image
-                print(f"Error: Failed to extract metadata for {img_path}. Skipping.")
-                error_count += 1
-                continue
-            
-            # The metadata dictionary from FashionTagger should now be directly usable.
-            # Example:
-            # metadata = {
-            #     "image_id": "img_001.jpg", "file_path": "/app/images/img_001.jpg",
-            #     "description": "ViT predicted label", "dominant_colors": ["(r,g,b)", ...],
-            #     "style_tags": ["tag1", "tag2"], "garment_type": "unknown",
-            #     "accessories": [], "gender": "unisex", "season": "summer"
-            # }
-
-            if insert_metadata_to_db(conn, metadata):
-                print(f"Successfully processed and saved metadata for {metadata['image_id']}")
-                inserted_count += 1
-            else:
-                # Error already printed by insert_metadata_to_db
-                error_count += 1
-                conn.rollback() # Rollback the failed transaction for this image
+    # Database writes run on a background thread so tagging never waits on INSERT round trips
+    row_queue = queue.Queue(maxsize=WRITER_QUEUE_SIZE)
+    writer_stats = {"inserted": 0, "errors": 0}
+    writer = threading.Thread(target=_db_writer, args=(conn, row_queue, write_batch, writer_stats), daemon=True)
+    writer.start()
+
+    try:
+        for batch_paths, batch_metadata in fashion_tagger_instance.iter_metadata_batches(image_files):
+            print(f"\nProcessed images ({processed_count + 1}-{processed_count + len(batch_paths)}/{len(image_files)})")
+            processed_count += len(batch_paths)
+
+            for img_path, metadata in zip(batch_paths, batch_metadata):
+                if metadata is None: # FashionTagger returns None for images it could not tag
+                    print(f"Error: Failed to extract metadata for {img_path}. Skipping.")
+                    error_count += 1
+                    continue
+
+                # The metadata dictionary from FashionTagger should now be directly usable.
+                # Example:
+                # metadata = {
+                #     "image_id": "img_001.jpg", "file_path": "/app/images/img_001.jpg",
+                #     "description": "ViT predicted label", "dominant_colors": ["(r,g,b)", ...],
+                #     "style_tags": ["tag1", "tag2"], "garment_type": "unknown",
+                #     "accessories": [], "gender": "unisex", "season": "summer"
+                # }
+                row_queue.put(metadata_to_row(metadata))
+    except Exception as e: # Catch errors from fashion_tagger or other unexpected issues
+        print(f"Critical error while tagging images: {e}. Skipping the remaining {len(image_files) - processed_count} images.")
+        error_count += len(image_files) - processed_count
+    finally:
+        row_queue.put(None) # Sentinel: no more rows
+        writer.join()
 
-        except Exception as e: # Catch errors from fashion_tagger.get_metadata or other unexpected issues
-            print(f"Critical error processing {img_path}: {e}. Skipping.")
-            error_count += 1
-            # No need to rollback here as transaction is per image or at the end
+    inserted_count = writer_stats["inserted"]
+    error_count += writer_stats["errors"]
 
     if error_count == 0 and inserted_count > 0:
-        conn.commit() 
         print(f"\nSuccessfully processed and inserted/updated metadata for all {inserted_count} images.")
     elif inserted_count > 0 and error_count > 0:
-        conn.commit() 
         print(f"\nCompleted processing. Successfully inserted/updated metadata for {inserted_count} images, but {error_count} images encountered errors.")
     elif error_count > 0 and inserted_count == 0:
         print(f"\nAll {error_count} images encountered errors during processing. No metadata was saved.")
@@ -193,6 +386,7 @@ if __name__ == "__main__":
         exit(1)
         
     process_images_and_store_metadata(fashion_tagger_instance)
+    fashion_tagger_instance.close()
 
     print("\nETL process finished.")
     print("Note: Some fields like 'garment_type', 'accessories', and 'gender' are currently placeholders ('unknown', [], 'unisex')")
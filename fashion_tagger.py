@@ -1,16 +1,120 @@
+import hashlib
+import inspect
+import io
 import os
+import shelve
+import numpy as np
 from PIL import Image
 import torch
 from transformers import AutoModelForImageClassification, AutoProcessor
 from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+# ONNX Runtime is optional; it is only used for int8 inference on CPU
+try:
+    import onnxruntime as ort
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+except ImportError:
+    ort = None
+
+# PyTurboJPEG (libjpeg-turbo bindings) is optional; it decodes JPEGs faster than stock Pillow
+try:
+    from turbojpeg import TJPF_RGB, TurboJPEG
+    _TURBO_JPEG = TurboJPEG()
+except Exception: # ImportError, or RuntimeError when the libturbojpeg shared library is missing
+    _TURBO_JPEG = None
 
 # Import configuration from config.py
 try:
-    from config import HUGGING_FACE_MODEL_NAME, IMAGE_SIZE
+    from config import (HUGGING_FACE_MODEL_NAME, IMAGE_SIZE, BATCH_SIZE_ETL, DECODE_WORKERS, USE_TORCH_COMPILE,
+                        USE_ONNX_RUNTIME_CPU, ONNX_CACHE_DIR, VIT_CACHE_PATH, PHASH_MAX_DISTANCE)
 except ImportError:
     print("Error: config.py not found or variables not set. Using default fallbacks.")
     HUGGING_FACE_MODEL_NAME = "google/vit-base-patch16-224-in21k"
     IMAGE_SIZE = (224, 224)
+    BATCH_SIZE_ETL = 32
+    DECODE_WORKERS = 4
+    USE_TORCH_COMPILE = True
+    USE_ONNX_RUNTIME_CPU = True
+    ONNX_CACHE_DIR = "./.onnx_cache"
+    VIT_CACHE_PATH = "./.vit_cache"
+    PHASH_MAX_DISTANCE = 4
+
+INFERENCE_ERROR_LABELS = ["ViT inference error"]
+
+# Working directory captured once; os.path.abspath would query it again for every image
+CWD = os.getcwd()
+
+def _absolute_path(path):
+    """Equivalent of os.path.abspath using the cached working directory."""
+    return os.path.normpath(path if os.path.isabs(path) else os.path.join(CWD, path))
+
+
+# DCT basis for the 32x32 perceptual hash, computed once
+_PHASH_SIZE = 32
+_PHASH_DCT = np.cos(np.pi * (2 * np.arange(_PHASH_SIZE)[None, :] + 1) * np.arange(_PHASH_SIZE)[:, None] / (2 * _PHASH_SIZE))
+
+def perceptual_hash(pil_image):
+    """
+    Computes a 64-bit DCT perceptual hash (pHash) of an image.
+
+    Near-identical images (re-encoded, slightly cropped or recompressed) get hashes
+    that differ in only a few bits.
+    """
+    pixels = np.asarray(pil_image.convert("L").resize((_PHASH_SIZE, _PHASH_SIZE), Image.LANCZOS), dtype=np.float64)
+    low_freq = (_PHASH_DCT @ pixels @ _PHASH_DCT.T)[:8, :8]
+    bits = (low_freq > np.median(low_freq)).flatten()
+    return int(np.packbits(bits).view(">u8")[0])
+
+def hamming_distance(a, b):
+    """Number of differing bits between two integer hashes."""
+    return bin(a ^ b).count("1")
+
+class BKTree:
+    """Burkhard-Keller tree over integer hashes for nearest-neighbour lookups by Hamming distance."""
+    def __init__(self):
+        self.root = None # Node layout: [hash, value, {distance: child_node}]
+
+    def insert(self, key, value):
+        """Adds a hash and its associated value."""
+        if self.root is None:
+            self.root = [key, value, {}]
+            return
+        node = self.root
+        while True:
+            distance = hamming_distance(key, node[0])
+            if distance == 0:
+                node[1] = value
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [key, value, {}]
+                return
+            node = child
+
+    def find(self, key, max_distance):
+        """Returns the value of the closest stored hash within max_distance, or None."""
+        best_distance, best_value = max_distance + 1, None
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node = stack.pop()
+            distance = hamming_distance(key, node[0])
+            if distance < best_distance:
+                best_distance, best_value = distance, node[1]
+            for child_distance, child in node[2].items():
+                if abs(child_distance - distance) <= max_distance:
+                    stack.append(child)
+        return best_value
+
+
+class _LogitsOnly(torch.nn.Module):
+    """Wraps a Hugging Face classifier so its forward returns the logits tensor (for ONNX export)."""
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, pixel_values):
+        return self.model(pixel_values=pixel_values).logits
 
 
 class FashionTagger:
@@ -20,84 +124,185 @@ class FashionTagger:
         """
         self.model = None
         self.processor = None
+        self.onnx_session = None
+        self._labels = None
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
         print(f"Using device: {self.device}")
 
         try:
             print(f"Loading model: {HUGGING_FACE_MODEL_NAME}...")
-            self.model = AutoModelForImageClassification.from_pretrained(HUGGING_FACE_MODEL_NAME).to(self.device)
+            self.model = AutoModelForImageClassification.from_pretrained(HUGGING_FACE_MODEL_NAME)
+            # bfloat16 weights on GPU halve memory traffic; CPU stays in float32
+            model_dtype = torch.bfloat16 if self.device == "cuda" else torch.float32
+            self.model = self.model.to(self.device, dtype=model_dtype).eval()
+            # Label lookup table indexed by class id, so top-k ids map to labels with one NumPy gather
+            id2label = self.model.config.id2label
+            self._labels = np.array([id2label[i] for i in range(len(id2label))], dtype=object)
             self.processor = AutoProcessor.from_pretrained(HUGGING_FACE_MODEL_NAME)
+            target_size = {"height": IMAGE_SIZE[1], "width": IMAGE_SIZE[0]}
+            if getattr(self.processor, "size", target_size) != target_size:
+                self.processor.size = target_size
             print("Model and processor loaded successfully.")
         except Exception as e:
             print(f"Error loading model/processor: {e}")
             print(f"Please check HUGGING_FACE_MODEL_NAME in config.py ('{HUGGING_FACE_MODEL_NAME}') and ensure you have an internet connection.")
             print("FashionTagger will not be functional.")
 
+        if self.model is not None and self.device == "cpu" and USE_ONNX_RUNTIME_CPU:
+            self._load_onnx_session()
+        if self.model is not None and self.onnx_session is None and USE_TORCH_COMPILE:
+            self._compile_model()
+
+        # Persistent cache of predicted labels keyed by image content hash, so reruns
+        # and duplicate images skip the ViT forward pass. Keys include the inference backend
+        # and precision, since int8 ONNX, bf16 GPU and fp32 CPU runs can predict different labels.
+        if self.onnx_session is not None:
+            self._cache_namespace = f"{HUGGING_FACE_MODEL_NAME}:onnx:int8"
+        else:
+            self._cache_namespace = f"{HUGGING_FACE_MODEL_NAME}:torch:{'bf16' if self.device == 'cuda' else 'fp32'}"
+        self.vision_cache = None
+        try:
+            self.vision_cache = shelve.open(VIT_CACHE_PATH)
+        except Exception as e:
+            print(f"Warning: Could not open ViT prediction cache at {VIT_CACHE_PATH}: {e}. Caching disabled.")
+
+        # In-memory index of predicted labels by perceptual hash, for near-duplicate images
+        self.phash_memo = BKTree() if PHASH_MAX_DISTANCE is not None else None
+
+    def _forward(self, inputs):
+        """
+        Runs the model and returns its logits. Uses the int8 ONNX Runtime session when one
+        is loaded, otherwise PyTorch without autograd bookkeeping (bfloat16 autocast on GPU).
+        """
+        if self.onnx_session is not None:
+            logits = self.onnx_session.run(None, {"pixel_values": inputs["pixel_values"].numpy()})[0]
+            return torch.from_numpy(logits)
+        with torch.inference_mode(), torch.autocast(device_type=self.device, dtype=torch.bfloat16, enabled=self.device == "cuda"):
+            return self.model(**inputs).logits
+
+    def _load_onnx_session(self):
+        """
+        Loads an int8 dynamically-quantized ONNX export of the model for CPU inference.
+
+        The export and quantization happen once; the quantized model is cached under
+        ONNX_CACHE_DIR and reused by later runs. Falls back to PyTorch on any failure.
+        """
+        if ort is None:
+            print("onnxruntime is not installed; using PyTorch on CPU. Install onnxruntime and onnx for faster CPU inference.")
+            return
+
+        model_slug = HUGGING_FACE_MODEL_NAME.strip("/").replace("/", "__")
+        fp32_path = os.path.join(ONNX_CACHE_DIR, f"{model_slug}.onnx")
+        int8_path = os.path.join(ONNX_CACHE_DIR, f"{model_slug}.int8.onnx")
+        try:
+            if not os.path.exists(int8_path):
+                print(f"Exporting model to ONNX and quantizing to int8 (one-time): {int8_path}")
+                os.makedirs(ONNX_CACHE_DIR, exist_ok=True)
+                dummy_pixels = torch.zeros((1, 3, *IMAGE_SIZE))
+                # The TorchScript exporter produces a graph quantize_dynamic can shape-infer;
+                # newer torch versions default to the dynamo exporter unless told otherwise.
+                export_kwargs = {"dynamo": False} if "dynamo" in inspect.signature(torch.onnx.export).parameters else {}
+                torch.onnx.export(
+                    _LogitsOnly(self.model), (dummy_pixels,), fp32_path,
+                    input_names=["pixel_values"], output_names=["logits"],
+                    dynamic_axes={"pixel_values": {0: "batch"}, "logits": {0: "batch"}},
+                    **export_kwargs,
+                )
+                quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+            self.onnx_session = ort.InferenceSession(int8_path, providers=["CPUExecutionProvider"])
+            print("Using int8 ONNX Runtime session for CPU inference.")
+        except Exception as e:
+            print(f"Warning: ONNX Runtime setup failed ({e}). Using PyTorch on CPU.")
+            self.onnx_session = None
+
+    def _compile_model(self):
+        """
+        Compiles the model with torch.compile and warms it up on a dummy batch of BATCH_SIZE_ETL
+        images (the shape of real batches, so they reuse the compiled graph instead of recompiling).
+        Falls back to eager mode on failure.
+        """
+        eager_model = self.model
+        try:
+            print("Compiling model with torch.compile (first run may take a while)...")
+            self.model = torch.compile(eager_model, mode="reduce-overhead", fullgraph=False)
+            dummy_pixels = torch.zeros((BATCH_SIZE_ETL, 3, IMAGE_SIZE[1], IMAGE_SIZE[0]), device=self.device)
+            self._forward({"pixel_values": dummy_pixels})
+            print("Model compiled and warmed up.")
+        except Exception as e:
+            print(f"Warning: torch.compile failed ({e}). Using the eager model.")
+            self.model = eager_model
+
+    def close(self):
+        """Flushes and closes the ViT prediction cache."""
+        if self.vision_cache is not None:
+            self.vision_cache.close()
+            self.vision_cache = None
+
+    def _cache_key(self, pil_image):
+        """Returns the vision cache key for an image: model, backend and precision plus a hash of its RGB pixels."""
+        digest = hashlib.blake2b(pil_image.tobytes(), digest_size=16)
+        digest.update(repr(pil_image.size).encode())
+        return f"{self._cache_namespace}:{digest.hexdigest()}"
+
     def _get_dominant_colors(self, pil_image, count=3):
         """
         Extracts dominant colors from a PIL image.
+
+        Pixels are quantized to 4 bits per channel and counted with a NumPy histogram,
+        so near-identical shades are grouped into one color.
         """
         try:
-            small_image = pil_image.resize((50, 50))
-            colors = small_image.getcolors(small_image.size[0] * small_image.size[1])
-            if not colors:
+            pixels = np.asarray(pil_image.resize((50, 50)).convert("RGB")).reshape(-1, 3)
+            quantized = (pixels >> 4).astype(np.uint16)
+            keys = (quantized[:, 0] << 8) | (quantized[:, 1] << 4) | quantized[:, 2]
+            values, counts = np.unique(keys, return_counts=True)
+            if values.size == 0:
                 return ["unknown"]
-            
-            # Sort by count (item[0] is count, item[1] is color)
-            sorted_colors = sorted(colors, key=lambda item: item[0], reverse=True)
-            
+
+            # Top-k colors by pixel count, most frequent first
+            k = min(count, values.size)
+            top = np.argpartition(-counts, k - 1)[:k]
+            top = top[np.argsort(-counts[top], kind="stable")]
+
             dominant_colors_rgb = []
-            for i in range(min(count, len(sorted_colors))):
-                # Ensure color is RGB, not RGBA or Palette index
-                color = sorted_colors[i][1]
-                if isinstance(color, int): # Palette index
-                    # Convert palette index to RGB
-                    palette = small_image.getpalette()
-                    if palette:
-                         r, g, b = palette[color*3 : color*3+3]
-                         dominant_colors_rgb.append(f"({r},{g},{b})")
-                    else: # No palette, likely grayscale or similar
-                        dominant_colors_rgb.append(f"({color},{color},{color})") # crude approx for grayscale
-                elif len(color) == 4: # RGBA
-                     dominant_colors_rgb.append(f"({color[0]},{color[1]},{color[2]})") # strip alpha
-                elif len(color) == 3: # RGB
-                    dominant_colors_rgb.append(f"({color[0]},{color[1]},{color[2]})")
-                else:
-                    dominant_colors_rgb.append("unknown_format")
-
-
-            return dominant_colors_rgb if dominant_colors_rgb else ["unknown"]
+            for key in values[top]:
+                r, g, b = ((key >> 8) & 0xF) << 4, ((key >> 4) & 0xF) << 4, (key & 0xF) << 4
+                dominant_colors_rgb.append(f"({r},{g},{b})")
+            return dominant_colors_rgb
         except Exception as e:
             print(f"Error getting dominant colors: {e}")
             return ["error_extracting_colors"] * count
 
-    def get_metadata(self, image_path):
-        """
-        Extracts metadata from an image using the ViT model and heuristics.
-
-        Args:
-            image_path (str): Path to the image file.
+    def _placeholder_metadata(self, image_path):
+        """Returns the metadata structure used when the model/processor is not available."""
+        return {
+            "image_id": os.path.basename(image_path),
+            "file_path": _absolute_path(image_path),
+            "description": "Model not loaded",
+            "dominant_colors": ["unknown"],
+            "style_tags": ["unknown"],
+            "garment_type": "unknown",
+            "accessories": [],
+            "gender": "unisex",
+            "season": "summer",
+        }
 
-        Returns:
-            dict: A dictionary containing extracted metadata.
+    def _load_image(self, image_path):
         """
-        if self.model is None or self.processor is None:
-            print("FashionTagger is not functional because model/processor failed to load.")
-            # Return placeholder metadata structure
-            return {
-                "image_id": os.path.basename(image_path),
-                "file_path": os.path.abspath(image_path),
-                "description": "Model not loaded",
-                "dominant_colors": ["unknown"],
-                "style_tags": ["unknown"],
-                "garment_type": "unknown",
-                "accessories": [],
-                "gender": "unisex",
-                "season": "summer",
-            }
+        Opens an image file as an RGB PIL image, or returns None if it cannot be read.
 
+        The file is read in a single call and decoded from memory, so on the decode
+        pool the disk read never interleaves with Pillow's incremental reads.
+        """
         try:
-            pil_image = Image.open(image_path).convert("RGB")
+            with open(image_path, "rb") as f:
+                data = f.read()
+            if _TURBO_JPEG is not None and image_path.lower().endswith((".jpg", ".jpeg")):
+                try:
+                    return Image.fromarray(_TURBO_JPEG.decode(data, pixel_format=TJPF_RGB))
+                except Exception:
+                    pass # Fall back to Pillow for files libjpeg-turbo rejects
+            return Image.open(io.BytesIO(data)).convert("RGB")
         except FileNotFoundError:
             print(f"Error: Image file not found at {image_path}")
             return None
@@ -105,37 +310,39 @@ class FashionTagger:
             print(f"Error opening or processing image {image_path}: {e}")
             return None
 
-        # Image Preprocessing for ViT
+    def _predict_labels(self, pil_images):
+        """
+        Runs one ViT forward pass over a batch of PIL images.
+
+        Returns:
+            list: One list of top-3 predicted labels per image, or None if preprocessing failed.
+        """
+        # Image Preprocessing for ViT (the processor accepts a list of images)
         try:
-            inputs = self.processor(images=pil_image.resize(IMAGE_SIZE), return_tensors="pt").to(self.device)
+            # The processor resizes to its configured size itself (matched to IMAGE_SIZE in __init__)
+            inputs = self.processor(images=pil_images, return_tensors="pt")
+            if self.device == "cuda":
+                # Page-locked copy, so the host-to-device transfer is issued asynchronously
+                inputs = {"pixel_values": inputs["pixel_values"].pin_memory().to(self.device, non_blocking=True)}
+            else:
+                inputs = inputs.to(self.device)
         except Exception as e:
-            print(f"Error processing image with ViT processor: {e}")
+            print(f"Error processing images with ViT processor: {e}")
             return None
-            
+
         # Model Inference
-        predicted_labels = ["ViT inference error"]
         try:
-            with torch.no_grad():
-                outputs = self.model(**inputs)
-            logits = outputs.logits
-            
-            # Get top-k predicted class labels (e.g., top 3)
-            top_k_preds = torch.topk(logits, k=3)
-            predicted_indices = top_k_preds.indices.squeeze().tolist()
-            
-            if isinstance(predicted_indices, int): # Handles k=1 or if only one logit is returned
-                predicted_indices = [predicted_indices]
-
-            predicted_labels = [self.model.config.id2label[idx] for idx in predicted_indices]
+            logits = self._forward(inputs)
 
+            # Get top-k predicted class labels (e.g., top 3) for every row of the batch
+            top_k_indices = torch.topk(logits, k=min(3, logits.shape[-1]), dim=-1).indices.cpu().numpy()
+            return self._labels[top_k_indices].tolist() # (batch, k) labels -> one list per image
         except Exception as e:
             print(f"Error during ViT model inference: {e}")
-            # predicted_labels will remain ["ViT inference error"] or similar
-
-        # Dominant Colors (Heuristic using Pillow)
-        dominant_colors = self._get_dominant_colors(pil_image, count=3)
+            return [INFERENCE_ERROR_LABELS for _ in pil_images]
 
-        # Metadata Assembly
+    def _build_metadata(self, image_path, predicted_labels, dominant_colors):
+        """Assembles the metadata dictionary for one image."""
         description = predicted_labels[0] if predicted_labels else "No ViT description"
         style_tags = predicted_labels # Using top-k ImageNet labels as style tags.
                                       # Limitation: These are general ImageNet labels (e.g., 'tabby cat', 'jersey')
@@ -147,9 +354,9 @@ class FashionTagger:
         accessories = []          # Limitation: ViT base model does not identify accessories.
         gender = "unisex"         # Limitation: ViT base model does not predict gender.
 
-        metadata = {
+        return {
             "image_id": os.path.basename(image_path),
-            "file_path": os.path.abspath(image_path),
+            "file_path": _absolute_path(image_path),
             "description": description,
             "dominant_colors": dominant_colors,
             "style_tags": style_tags,
@@ -158,7 +365,120 @@ class FashionTagger:
             "gender": gender,
             "season": "summer",  # Fixed as per requirements
         }
-        return metadata
+
+    def iter_metadata_batches(self, image_paths, batch_size=BATCH_SIZE_ETL, vision_cache=True):
+        """
+        Extracts metadata for several images, yielding results one batch at a time.
+
+        Image decoding for the next batch and dominant-color extraction run on a thread
+        pool, overlapping with the model forward pass of the current batch.
+
+        Args:
+            image_paths (list): Paths to the image files.
+            batch_size (int): Number of images per model forward pass.
+            vision_cache (bool): Reuse/store predicted labels in the content-hash cache and
+                                 reuse results of near-duplicate images (perceptual hash).
+
+        Yields:
+            tuple: (batch_paths, batch_metadata) where batch_metadata holds one metadata
+                   dictionary per path, or None for images that could not be opened or preprocessed.
+        """
+        batches = [image_paths[start:start + batch_size] for start in range(0, len(image_paths), batch_size)]
+        if self.model is None or self.processor is None:
+            print("FashionTagger is not functional because model/processor failed to load.")
+            for batch_paths in batches:
+                yield batch_paths, [self._placeholder_metadata(path) for path in batch_paths]
+            return
+
+        cache = self.vision_cache if vision_cache else None
+        memo = self.phash_memo if vision_cache else None
+        with ThreadPoolExecutor(max_workers=DECODE_WORKERS) as pool:
+            next_decodes = [pool.submit(self._load_image, path) for path in batches[0]] if batches else []
+            for index, batch_paths in enumerate(batches):
+                decodes = next_decodes
+                if index + 1 < len(batches): # Prefetch the next batch while this one runs through the model
+                    next_decodes = [pool.submit(self._load_image, path) for path in batches[index + 1]]
+                pil_images = [future.result() for future in decodes]
+
+                # Serve cached predictions first: exact content-hash hits, then near-duplicates
+                # found by perceptual hash. Only the remaining images go through the model.
+                labels_by_path = {}
+                phash_by_path = {}
+                to_infer = []
+                for path, img in zip(batch_paths, pil_images):
+                    if img is None:
+                        continue
+                    key = self._cache_key(img) if cache is not None else None
+                    if key is not None and key in cache:
+                        labels_by_path[path] = cache[key]
+                        continue
+                    if memo is not None:
+                        phash = perceptual_hash(img)
+                        match = memo.find(phash, PHASH_MAX_DISTANCE)
+                        if match is not None:
+                            labels_by_path[path] = match
+                            continue
+                        phash_by_path[path] = phash
+                    to_infer.append((path, img, key))
+
+                if to_infer:
+                    labels_per_image = self._predict_labels([img for _, img, _ in to_infer])
+                    if labels_per_image is not None:
+                        for (path, _, key), labels in zip(to_infer, labels_per_image):
+                            labels_by_path[path] = labels
+                            if key is not None and labels is not INFERENCE_ERROR_LABELS:
+                                cache[key] = labels
+
+                # Dominant Colors (Heuristic using NumPy), computed on the pool for every image:
+                # the perceptual hash only sees luminance, so near-duplicates may differ in color
+                color_futures = {
+                    path: pool.submit(self._get_dominant_colors, img)
+                    for path, img in zip(batch_paths, pil_images)
+                    if path in labels_by_path
+                }
+                colors_by_path = {path: future.result() for path, future in color_futures.items()}
+
+                # Remember freshly tagged images for later near-duplicate lookups
+                for path, phash in phash_by_path.items():
+                    if path in labels_by_path and labels_by_path[path] is not INFERENCE_ERROR_LABELS:
+                        memo.insert(phash, labels_by_path[path])
+
+                batch_metadata = [
+                    self._build_metadata(path, labels_by_path[path], colors_by_path[path])
+                    if path in labels_by_path else None
+                    for path in batch_paths
+                ]
+                yield batch_paths, batch_metadata
+
+    def get_metadata_batch(self, image_paths, batch_size=BATCH_SIZE_ETL, vision_cache=True):
+        """
+        Extracts metadata for several images, running the ViT model on batches of images.
+
+        Args:
+            image_paths (list): Paths to the image files.
+            batch_size (int): Number of images per model forward pass.
+            vision_cache (bool): Reuse/store predicted labels in the content-hash cache.
+
+        Returns:
+            list: One metadata dictionary per path, in the same order. Entries are None
+                  for images that could not be opened or preprocessed.
+        """
+        results = []
+        for _, batch_metadata in self.iter_metadata_batches(image_paths, batch_size, vision_cache):
+            results.extend(batch_metadata)
+        return results
+
+    def get_metadata(self, image_path):
+        """
+        Extracts metadata from an image using the ViT model and heuristics.
+
+        Args:
+            image_path (str): Path to the image file.
+
+        Returns:
+            dict: A dictionary containing extracted metadata.
+        """
+        return self.get_metadata_batch([image_path])[0]
 
 if __name__ == '__main__':
     print("Running FashionTagger example...")
@@ -199,6 +519,7 @@ if __name__ == '__main__':
                     print(f"  {key}: {value}")
             else:
                 print("Metadata extraction failed for the sample image.")
+            tagger.close()
         else:
             print("FashionTagger did not initialize correctly. Cannot run example.")
     else:
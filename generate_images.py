@@ -1,6 +1,6 @@
 import os
-from PIL import Image, ImageDraw
-import random
+import numpy as np
+from PIL import Image
 
 # Create the images directory if it doesn't exist
 if not os.path.exists("images"):
@@ -9,9 +9,13 @@ if not os.path.exists("images"):
 # Image dimensions
 width = 23
 height = 23
+num_images = 30
+
+# Seed for the random generator; set to an int to make the generated images reproducible
+SEED = None
 
 # List of summer colors
-summer_colors = [
+summer_colors = np.array([
     (255, 228, 181),  # Moccasin (sand)
     (135, 206, 250),  # Light Sky Blue
     (255, 182, 193),  # Light Pink
@@ -22,48 +26,63 @@ summer_colors = [
     (255, 250, 205),  # Lemon Chiffon
     (173, 216, 230),  # Light Blue
     (244, 164, 96),   # Sandy Brown
-]
+], dtype=np.uint8)
 
-# Function to generate a random color
-def get_random_color():
-    return (random.randint(0, 255), random.randint(0, 255), random.randint(0, 255))
+SHAPE_TYPES = ("rectangle", "ellipse", "line")
 
-# Generate 30 images
-for i in range(1, 31):
-    # Create a new image with a random summer background color
-    bg_color = random.choice(summer_colors)
-    image = Image.new("RGB", (width, height), bg_color)
-    draw = ImageDraw.Draw(image)
+# Pixel-center coordinate grids, computed once and shared by every shape mask
+YY, XX = np.mgrid[0:height, 0:width]
+
+def rectangle_mask(x1, y1, x2, y2):
+    """Boolean mask of a filled axis-aligned rectangle."""
+    return (XX >= x1) & (XX <= x2) & (YY >= y1) & (YY <= y2)
 
-    # Add a simple geometric shape with a random color
-    shape_color = get_random_color()
-    # Ensure shape color is different from background color
-    while shape_color == bg_color:
-        shape_color = get_random_color()
+def ellipse_mask(x1, y1, x2, y2):
+    """Boolean mask of a filled ellipse inscribed in the bounding box."""
+    cx, cy = (x1 + x2) / 2, (y1 + y2) / 2
+    rx, ry = max((x2 - x1) / 2, 0.5), max((y2 - y1) / 2, 0.5)
+    return ((XX - cx) / rx) ** 2 + ((YY - cy) / ry) ** 2 <= 1.0
 
-    # Randomly choose a shape type
-    shape_type = random.choice(["rectangle", "ellipse", "line"])
+def line_mask(x1, y1, x2, y2, line_width):
+    """Boolean mask of a thick line segment from (x1, y1) to (x2, y2)."""
+    dx, dy = x2 - x1, y2 - y1
+    t = np.clip(((XX - x1) * dx + (YY - y1) * dy) / max(dx * dx + dy * dy, 1), 0.0, 1.0)
+    distance = np.hypot(XX - (x1 + t * dx), YY - (y1 + t * dy))
+    return distance <= line_width / 2
 
-    # Define shape coordinates (can be randomized further)
-    x1 = random.randint(3, 8)
-    y1 = random.randint(3, 8)
-    x2 = random.randint(15, 20)
-    y2 = random.randint(15, 20)
+# Draw every random parameter for all images up front
+rng = np.random.default_rng(SEED)
+bg_colors = summer_colors[rng.integers(0, len(summer_colors), size=num_images)]
+shape_colors = rng.integers(0, 256, size=(num_images, 3), dtype=np.uint8)
+# Ensure shape color is different from background color
+same_color = (shape_colors == bg_colors).all(axis=1)
+while same_color.any():
+    shape_colors[same_color] = rng.integers(0, 256, size=(same_color.sum(), 3), dtype=np.uint8)
+    same_color = (shape_colors == bg_colors).all(axis=1)
+shape_types = rng.integers(0, len(SHAPE_TYPES), size=num_images)
+x1s, y1s = rng.integers(3, 9, size=(2, num_images))
+x2s, y2s = rng.integers(15, 21, size=(2, num_images))
+line_widths = rng.integers(2, 5, size=num_images)
+cross_widths = rng.integers(2, 4, size=num_images)
+
+# Generate 30 images
+for i in range(num_images):
+    x1, y1, x2, y2 = x1s[i], y1s[i], x2s[i], y2s[i]
+    shape_type = SHAPE_TYPES[shape_types[i]]
 
     if shape_type == "rectangle":
-        draw.rectangle([(x1, y1), (x2, y2)], fill=shape_color)
+        mask = rectangle_mask(x1, y1, x2, y2)
     elif shape_type == "ellipse":
-        draw.ellipse([(x1, y1), (x2, y2)], fill=shape_color)
-    elif shape_type == "line":
-        # For a line, make it thicker
-        draw.line([(x1, y1), (x2, y2)], fill=shape_color, width=random.randint(2,4))
-        # Add another line to make it more visible
-        draw.line([(x1, y2), (x2, y1)], fill=shape_color, width=random.randint(2,3))
+        mask = ellipse_mask(x1, y1, x2, y2)
+    else:
+        # For a line, make it thicker and add a crossing line to make it more visible
+        mask = line_mask(x1, y1, x2, y2, line_widths[i]) | line_mask(x1, y2, x2, y1, cross_widths[i])
 
+    pixels = np.where(mask[..., None], shape_colors[i], bg_colors[i]).astype(np.uint8)
 
     # Save the image
-    image_name = f"img_{i:03d}.jpg"
+    image_name = f"img_{i + 1:03d}.jpg"
     image_path = os.path.join("images", image_name)
-    image.save(image_path)
+    Image.fromarray(pixels).save(image_path, quality=85, optimize=False)
 
-print("Generated 30 images in the 'images' directory.")
+print(f"Generated {num_images} images in the 'images' directory.")
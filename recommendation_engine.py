@@ -1,8 +1,14 @@
 import os
+import heapq
+import threading
+import weakref
 import psycopg2
-from psycopg2 import sql, extras
+from psycopg2 import sql, extras, pool
 import random
-from collections import Counter
+from collections import Counter, OrderedDict, namedtuple
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from db_schema import ensure_schema
 
 # Database connection details from environment variables
 DB_HOST = os.environ.get("DB_HOST", "localhost")
@@ -14,22 +20,146 @@ DB_PASSWORD = os.environ.get("DB_PASSWORD", "postgres")
 # These are example users; in a real system, this would be dynamic.
 TARGET_USER_IDS = ["user001", "user005", "user010"]
 
+# Where candidate scoring runs: "python" (default) or "sql" to score, rank and pick the
+# top 3 for every pair server-side in a single statement (see score_recommendations_in_db).
+RECOMMENDATION_SCORING = os.environ.get("RECOMMENDATION_SCORING", "python").lower()
+# With SQL scoring, pairs are split into chunks of this size that are scored concurrently,
+# each on its own pooled connection, by up to RECOMMENDATION_WORKERS threads
+SQL_SCORING_CHUNK_SIZE = int(os.environ.get("SQL_SCORING_CHUNK_SIZE", "500"))
+RECOMMENDATION_WORKERS = int(os.environ.get("RECOMMENDATION_WORKERS", "4"))
+
+# Connection pool bounds; connections are opened lazily and reused across calls
+DB_POOL_MIN_CONN = int(os.environ.get("DB_POOL_MIN_CONN", "1"))
+DB_POOL_MAX_CONN = int(os.environ.get("DB_POOL_MAX_CONN", "8"))
+
+_POOL = None
+_POOL_LOCK = threading.Lock()
+
+# Bounds of the in-process caches of image metadata and navigation paths
+METADATA_CACHE_SIZE = int(os.environ.get("METADATA_CACHE_SIZE", "100000"))
+NAVIGATION_CACHE_SIZE = int(os.environ.get("NAVIGATION_CACHE_SIZE", "10000"))
+
+CacheInfo = namedtuple("CacheInfo", ["hits", "misses", "maxsize", "currsize"])
+
+class LRUCache:
+    """Thread-safe dictionary bounded to maxsize entries, evicting the least recently used."""
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, keys):
+        """Returns {key: value} for the cached keys among `keys`."""
+        found = {}
+        with self._lock:
+            for key in keys:
+                if key in self._data:
+                    self._data.move_to_end(key)
+                    found[key] = self._data[key]
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, items):
+        """Stores every (key, value) of the `items` dictionary."""
+        with self._lock:
+            for key, value in items.items():
+                self._data[key] = value
+                self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = 0
+
+    def cache_info(self):
+        with self._lock:
+            return CacheInfo(self.hits, self.misses, self.maxsize, len(self._data))
+
+# Live for the whole process, so a long-running engine (periodic job, web handler) skips
+# queries for images it has already seen. Call clear_caches() after re-running the ETL
+# or semantic enrichment.
+_METADATA_CACHE = LRUCache(METADATA_CACHE_SIZE)
+_NAVIGATION_CACHE = LRUCache(NAVIGATION_CACHE_SIZE)
+
+# Lookup queries PREPAREd once per connection and run with EXECUTE, so the server parses and
+# plans them once per session instead of on every call. Each takes a text[] of ids as $1.
+PREPARED_STATEMENTS = {
+    "clicked_history_batch": """
+        SELECT user_id, array_agg(image_id ORDER BY timestamp, interaction_id)
+        FROM user_interactions
+        WHERE user_id = ANY($1) AND clicked = TRUE
+        GROUP BY user_id
+    """,
+    "image_metadata_batch": """
+        SELECT image_id, style_tags, dominant_colors, garment_type
+        FROM image_metadata
+        WHERE image_id = ANY($1)
+    """,
+    "navigation_paths_batch": """
+        SELECT source_image_id, next_possible_images, path_scores
+        FROM image_navigation_paths
+        WHERE source_image_id = ANY($1)
+    """,
+}
+_PREPARED_CONNECTIONS = weakref.WeakSet() # Connections whose session already has the statements
+
+def _ensure_prepared(conn):
+    """PREPAREs PREPARED_STATEMENTS on the connection's session the first time it is used."""
+    if conn in _PREPARED_CONNECTIONS:
+        return
+    with conn.cursor() as cur:
+        cur.execute("".join(f"PREPARE {name}(text[]) AS {statement};" for name, statement in PREPARED_STATEMENTS.items()))
+    _PREPARED_CONNECTIONS.add(conn) # PREPARE is not undone by a rollback, so this stays valid
+
+def clear_caches():
+    """Empties the image metadata and navigation path caches."""
+    _METADATA_CACHE.clear()
+    _NAVIGATION_CACHE.clear()
+
+def _get_pool():
+    """Returns the shared connection pool, creating it on first use."""
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            _POOL = pool.ThreadedConnectionPool(
+                DB_POOL_MIN_CONN, DB_POOL_MAX_CONN,
+                host=DB_HOST, dbname=DB_NAME, user=DB_USER, password=DB_PASSWORD
+            )
+    return _POOL
+
 def get_db_connection():
-    """Establishes a connection to the PostgreSQL database."""
+    """Borrows a connection to the PostgreSQL database from the shared pool."""
     try:
-        conn = psycopg2.connect(host=DB_HOST, dbname=DB_NAME, user=DB_USER, password=DB_PASSWORD)
-        return conn
-    except psycopg2.OperationalError as e:
+        return _get_pool().getconn()
+    except (psycopg2.OperationalError, pool.PoolError) as e:
         print(f"Error connecting to the database: {e}")
         return None
 
+def release_db_connection(conn):
+    """Returns a borrowed connection to the pool (an open transaction is rolled back)."""
+    if _POOL is not None and conn is not None:
+        _POOL.putconn(conn)
+
+@contextmanager
+def db_connection():
+    """Borrows a pooled connection for the duration of a with-block (yields None if unavailable)."""
+    conn = get_db_connection()
+    try:
+        yield conn
+    finally:
+        release_db_connection(conn)
+
 def create_tables_if_not_exist(conn):
-    """Creates tables from schema.sql if they don't exist."""
+    """Creates tables from schema.sql if they don't exist and sets up the tsm_system_rows extension."""
     try:
-        with open("schema.sql", "r") as f:
-            schema_sql = f.read()
         with conn.cursor() as cur:
-            cur.execute(schema_sql)
+            ensure_schema(cur)
+        setup_tsm_system_rows(conn) # Used by get_random_image
         conn.commit()
         print("Tables from schema.sql checked/created successfully.")
     except (FileNotFoundError, psycopg2.Error) as e:
@@ -38,112 +168,180 @@ def create_tables_if_not_exist(conn):
         return False
     return True
 
-def get_last_clicked_image_for_users(conn, user_ids):
+# Reasons are kept as (code, key) tuples while scoring and only rendered for the selected items
+REASON_COMPLEMENT, REASON_STYLE, REASON_COLOR, REASON_GARMENT = range(4)
+REASON_TEMPLATES = {
+    REASON_COMPLEMENT: "This item complements your current selection.",
+    REASON_STYLE: "You previously liked items with similar '{}' style.",
+    REASON_COLOR: "You previously liked items with similar '{}' color.",
+    REASON_GARMENT: "You previously liked '{}' type items.",
+}
+
+def render_reasons(reason_codes):
+    """Turns a candidate's (code, key) reason tuples into its sorted reason text."""
+    return ". ".join(sorted(REASON_TEMPLATES[code].format(key) for code, key in reason_codes))
+
+# Whether TABLESAMPLE SYSTEM_ROWS can be used; resolved once per process (all connections share one database)
+_TSM_SYSTEM_ROWS_AVAILABLE = None
+
+def setup_tsm_system_rows(conn):
     """
-    Fetches the last clicked image_id for a list of user_ids.
-    Returns a dictionary {user_id: image_id or None}.
+    Schema-setup step: installs the tsm_system_rows extension (TABLESAMPLE SYSTEM_ROWS) if the
+    server ships it and the user may create it. Returns True if it can be used.
     """
-    if not user_ids:
-        return {}
-    
-    query = sql.SQL("""
-        SELECT DISTINCT ON (user_id) user_id, image_id
-        FROM user_interactions
-        WHERE user_id IN %s AND clicked = TRUE
-        ORDER BY user_id, timestamp DESC;
-    """)
-    
-    user_last_clicked = {}
-    try:
-        with conn.cursor(cursor_factory=extras.DictCursor) as cur:
-            cur.execute(query, (tuple(user_ids),))
-            records = cur.fetchall()
-            for record in records:
-                user_last_clicked[record['user_id']] = record['image_id']
-        
-        # For users who might not have clicked anything, assign None (or a random image later)
-        for user_id in user_ids:
-            if user_id not in user_last_clicked:
-                user_last_clicked[user_id] = None # Will be handled by fetching a random image
-        return user_last_clicked
-    except psycopg2.Error as e:
-        print(f"Error fetching last clicked images: {e}")
-        return {user_id: None for user_id in user_ids} # Default to None on error
+    global _TSM_SYSTEM_ROWS_AVAILABLE
+    with conn.cursor() as cur:
+        cur.execute("SELECT installed_version IS NOT NULL FROM pg_available_extensions WHERE name = 'tsm_system_rows';")
+        record = cur.fetchone()
+        if record is None:
+            _TSM_SYSTEM_ROWS_AVAILABLE = False # Not shipped with this server (contrib package missing)
+        elif record[0]:
+            _TSM_SYSTEM_ROWS_AVAILABLE = True
+        else:
+            cur.execute("SAVEPOINT create_tsm_system_rows;")
+            try:
+                cur.execute("CREATE EXTENSION IF NOT EXISTS tsm_system_rows;")
+                cur.execute("RELEASE SAVEPOINT create_tsm_system_rows;")
+                _TSM_SYSTEM_ROWS_AVAILABLE = True
+            except psycopg2.Error as e:
+                print(f"Could not create extension tsm_system_rows ({e.pgerror or e}); sampling by offset instead.")
+                cur.execute("ROLLBACK TO SAVEPOINT create_tsm_system_rows;")
+                _TSM_SYSTEM_ROWS_AVAILABLE = False
+    return _TSM_SYSTEM_ROWS_AVAILABLE
+
+def _tsm_system_rows_available(conn):
+    """Whether tsm_system_rows is installed; looked up once (read-only) unless schema setup already did."""
+    global _TSM_SYSTEM_ROWS_AVAILABLE
+    if _TSM_SYSTEM_ROWS_AVAILABLE is None:
+        with conn.cursor() as cur:
+            cur.execute("SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'tsm_system_rows');")
+            _TSM_SYSTEM_ROWS_AVAILABLE = cur.fetchone()[0]
+    return _TSM_SYSTEM_ROWS_AVAILABLE
 
 def get_random_image(conn):
-    """Fetches a single random image_id from image_metadata."""
+    """
+    Fetches a single random image_id from image_metadata without sorting the whole table:
+    TABLESAMPLE SYSTEM_ROWS(1) when tsm_system_rows is available, otherwise a random OFFSET
+    bounded by the planner's row estimate (an exact count if the table was never analyzed or
+    the estimate overshoots).
+    """
     try:
         with conn.cursor() as cur:
-            cur.execute("SELECT image_id FROM image_metadata ORDER BY RANDOM() LIMIT 1;")
+            if _tsm_system_rows_available(conn):
+                cur.execute("SELECT image_id FROM image_metadata TABLESAMPLE SYSTEM_ROWS(1);")
+                record = cur.fetchone()
+                if record:
+                    return record[0]
+            cur.execute("""
+                SELECT image_id FROM image_metadata
+                OFFSET floor(random() * (
+                    SELECT CASE WHEN reltuples >= 1 THEN reltuples ELSE (SELECT count(*) FROM image_metadata) END
+                    FROM pg_class WHERE oid = 'image_metadata'::regclass
+                ))
+                LIMIT 1;
+            """)
             record = cur.fetchone()
+            if record is None: # Row estimate larger than the table
+                cur.execute("SELECT image_id FROM image_metadata OFFSET floor(random() * (SELECT count(*) FROM image_metadata)) LIMIT 1;")
+                record = cur.fetchone()
             return record[0] if record else None
     except psycopg2.Error as e:
         print(f"Error fetching random image: {e}")
         return None
 
-def get_user_clicked_history(conn, user_id):
-    """Fetches all image_ids clicked by a user."""
+def get_clicked_history_batch(conn, user_ids):
+    """
+    Fetches the clicked image_ids of several users in one query, oldest click first, so the
+    last element is the user's last clicked image.
+    Returns a dictionary {user_id: [image_id, ...]}; users without clicks map to [].
+    """
+    if not user_ids:
+        return {}
     try:
+        _ensure_prepared(conn)
         with conn.cursor() as cur:
-            cur.execute("SELECT image_id FROM user_interactions WHERE user_id = %s AND clicked = TRUE;", (user_id,))
-            return [row[0] for row in cur.fetchall()]
+            cur.execute("EXECUTE clicked_history_batch(%s);", (list(user_ids),))
+            history = dict(cur.fetchall())
+        return {user_id: history.get(user_id, []) for user_id in user_ids}
     except psycopg2.Error as e:
-        print(f"Error fetching user history for {user_id}: {e}")
-        return []
+        print(f"Error fetching clicked history for users {user_ids}: {e}")
+        return {user_id: [] for user_id in user_ids}
 
 def get_image_metadata_batch(conn, image_ids):
-    """Fetches metadata for a list of image_ids."""
+    """Fetches metadata for a list of image_ids, querying only those not in the metadata cache."""
     if not image_ids: return {}
+    image_ids = list(dict.fromkeys(image_ids))
+    metadata = _METADATA_CACHE.get_many(image_ids)
+    missing_ids = [image_id for image_id in image_ids if image_id not in metadata]
+    if not missing_ids:
+        return metadata
     try:
+        _ensure_prepared(conn)
         with conn.cursor(cursor_factory=extras.DictCursor) as cur:
-            cur.execute("SELECT image_id, style_tags, dominant_colors, garment_type FROM image_metadata WHERE image_id IN %s;", (tuple(image_ids),))
-            return {row['image_id']: dict(row) for row in cur.fetchall()}
+            cur.execute("EXECUTE image_metadata_batch(%s);", (missing_ids,))
+            fetched = {row['image_id']: dict(row) for row in cur.fetchall()}
+        _METADATA_CACHE.put_many(fetched)
+        metadata.update(fetched)
+        return metadata
     except psycopg2.Error as e:
         print(f"Error fetching image metadata batch: {e}")
-        return {}
+        return metadata
 
-def get_navigation_path_for_source(conn, source_image_id):
-    """Fetches next_possible_images and path_scores for a source_image_id."""
+def get_navigation_paths_batch(conn, source_image_ids):
+    """
+    Fetches next_possible_images and path_scores for several source images in one query,
+    skipping sources already in the navigation path cache.
+    Returns a dictionary {source_image_id: (next_possible_images, path_scores)}; sources
+    without a navigation path map to ([], []).
+    """
+    if not source_image_ids:
+        return {}
+    source_image_ids = list(dict.fromkeys(source_image_ids))
+    paths = {source_image_id: ([], []) for source_image_id in source_image_ids}
+    paths.update(_NAVIGATION_CACHE.get_many(source_image_ids))
+    missing_ids = [source_image_id for source_image_id in source_image_ids if not paths[source_image_id][0]]
+    if not missing_ids:
+        return paths
     try:
-        with conn.cursor(cursor_factory=extras.DictCursor) as cur:
-            cur.execute("SELECT next_possible_images, path_scores FROM image_navigation_paths WHERE source_image_id = %s;", (source_image_id,))
-            record = cur.fetchone()
-            if record and record['next_possible_images'] and record['path_scores']:
-                return record['next_possible_images'], record['path_scores']
-            return [], []
+        _ensure_prepared(conn)
+        with conn.cursor() as cur:
+            cur.execute("EXECUTE navigation_paths_batch(%s);", (missing_ids,))
+            fetched = {
+                source_image_id: (next_images, scores)
+                for source_image_id, next_images, scores in cur.fetchall()
+                if next_images and scores
+            }
+        _NAVIGATION_CACHE.put_many(fetched) # Sources without a path are not cached, so new paths are picked up
+        paths.update(fetched)
+        return paths
     except psycopg2.Error as e:
-        print(f"Error fetching navigation path for {source_image_id}: {e}")
-        return [], []
-
-def generate_recommendations_for_pair(conn, user_id, source_image_id, all_metadata_cache):
-    """Generates recommendations for a single user and source image."""
-    user_clicked_history = get_user_clicked_history(conn, user_id)
-    
-    # Fetch metadata for source image if not in cache
-    if source_image_id not in all_metadata_cache:
-        meta = get_image_metadata_batch(conn, [source_image_id])
-        if meta: all_metadata_cache.update(meta)
+        print(f"Error fetching navigation paths for {missing_ids}: {e}")
+        return paths
 
+def generate_recommendations_for_pair(user_id, source_image_id, all_metadata_cache, user_clicked_history, navigation_path):
+    """
+    Generates recommendations for a single user and source image.
+    user_clicked_history is the user's list of clicked image_ids (see get_clicked_history_batch) and
+    navigation_path the source image's (next_possible_images, path_scores) (see get_navigation_paths_batch).
+    all_metadata_cache must already hold the metadata of the source, liked and candidate images;
+    this function makes no database queries.
+    """
     source_image_meta = all_metadata_cache.get(source_image_id)
     if not source_image_meta:
         print(f"Skipping recommendations for user {user_id}: Source image {source_image_id} metadata not found.")
         return [], []
 
-    # Fetch user liked items' metadata
+    # User liked items' metadata (from the prefetched cache)
     liked_items_metadata_list = []
     if user_clicked_history:
-        # Ensure metadata for liked items is in cache
-        missing_liked_meta_ids = [img_id for img_id in user_clicked_history if img_id not in all_metadata_cache]
-        if missing_liked_meta_ids:
-             all_metadata_cache.update(get_image_metadata_batch(conn, missing_liked_meta_ids))
         liked_items_metadata_list = [all_metadata_cache[img_id] for img_id in user_clicked_history if img_id in all_metadata_cache]
 
     # 1. Initial Candidates from navigation paths
-    nav_candidates, nav_scores = get_navigation_path_for_source(conn, source_image_id)
+    nav_candidates, nav_scores = navigation_path
     
     candidate_scores = {}
     for img_id, score in zip(nav_candidates, nav_scores):
-        candidate_scores[img_id] = {"score": score, "reasons": ["This item complements your current selection."]}
+        candidate_scores[img_id] = {"score": score, "reasons": [(REASON_COMPLEMENT, None)]}
 
     # 2. Filter Out
     filtered_candidates = {}
@@ -154,16 +352,15 @@ def generate_recommendations_for_pair(conn, user_id, source_image_id, all_metada
             continue
         filtered_candidates[img_id] = data
     
-    # Ensure metadata for candidates is cached
-    missing_candidate_meta_ids = [img_id for img_id in filtered_candidates if img_id not in all_metadata_cache]
-    if missing_candidate_meta_ids:
-        all_metadata_cache.update(get_image_metadata_batch(conn, missing_candidate_meta_ids))
-
     # 3. Scoring & Boosting based on user history
     if liked_items_metadata_list:
         common_style_tags = Counter(tag for item_meta in liked_items_metadata_list for tag in item_meta.get('style_tags', []))
         common_colors = Counter(color for item_meta in liked_items_metadata_list for color in item_meta.get('dominant_colors', []))
-        common_garment_types = Counter(item_meta.get('garment_type') for item_meta in liked_items_metadata_list if item_meta.get('garment_type'))
+        common_garment_types = frozenset(item_meta.get('garment_type') for item_meta in liked_items_metadata_list if item_meta.get('garment_type'))
+        # Boost per liked tag/color, computed once per user, so each candidate tag costs one dict lookup
+        style_boosts = {tag: 0.1 * count for tag, count in common_style_tags.items()} # More liked, more boost
+        color_boosts = {color: 0.05 * count for color, count in common_colors.items()}
+        source_garment = source_image_meta.get('garment_type')
 
         for img_id, data in filtered_candidates.items():
             candidate_meta = all_metadata_cache.get(img_id)
@@ -172,60 +369,193 @@ def generate_recommendations_for_pair(conn, user_id, source_image_id, all_metada
             boost_reasons = []
             # Boost for matching style tags
             for tag in candidate_meta.get('style_tags', []):
-                if tag in common_style_tags:
-                    data['score'] += 0.1 * common_style_tags[tag] # More liked, more boost
-                    boost_reasons.append(f"You previously liked items with similar '{tag}' style.")
+                boost = style_boosts.get(tag)
+                if boost is not None:
+                    data['score'] += boost
+                    boost_reasons.append((REASON_STYLE, tag))
             # Boost for matching dominant colors
             for color in candidate_meta.get('dominant_colors', []):
-                if color in common_colors:
-                    data['score'] += 0.05 * common_colors[color]
-                    boost_reasons.append(f"You previously liked items with similar '{color}' color.")
+                boost = color_boosts.get(color)
+                if boost is not None:
+                    data['score'] += boost
+                    boost_reasons.append((REASON_COLOR, color))
             # Boost for matching garment type (if different from source image's garment type, to encourage variety unless it's a strong match)
             cand_garment = candidate_meta.get('garment_type')
-            if cand_garment and cand_garment in common_garment_types and cand_garment != source_image_meta.get('garment_type'):
+            if cand_garment and cand_garment in common_garment_types and cand_garment != source_garment:
                 data['score'] += 0.2 
-                boost_reasons.append(f"You previously liked '{cand_garment}' type items.")
+                boost_reasons.append((REASON_GARMENT, cand_garment))
             
             if boost_reasons:
-                 # Prioritize new reasons if they are specific
-                if "This item complements your current selection." in data['reasons'] and len(boost_reasons) > 0:
-                    data['reasons'] = boost_reasons
-                else:
-                    data['reasons'].extend(boost_reasons)
-                # Remove duplicates
-                data['reasons'] = sorted(list(set(data['reasons'])))
+                # Specific reasons replace the generic one; dict.fromkeys drops duplicates in O(n)
+                data['reasons'] = list(dict.fromkeys(boost_reasons))
 
 
     # 4. Ranking & Selection
-    # Sort by score
-    sorted_candidates = sorted(filtered_candidates.items(), key=lambda item: item[1]['score'], reverse=True)
+    # Top 3 by score without sorting every candidate (ties keep navigation path order, as sorted() did)
+    top_3_candidates = heapq.nlargest(3, filtered_candidates.items(), key=lambda item: item[1]['score'])
     
     top_3_recommendations = []
     top_3_reasons = []
-    for img_id, data in sorted_candidates[:3]:
+    for img_id, data in top_3_candidates:
         top_3_recommendations.append(img_id)
-        top_3_reasons.append(". ".join(data['reasons']))
+        top_3_reasons.append(render_reasons(data['reasons']))
         
     return top_3_recommendations, top_3_reasons
 
 
-def insert_recommendations(conn, user_id, source_image_id, recommended_ids, reasons_text):
-    """Inserts generated recommendations into the recommendations table."""
-    if not recommended_ids:
-        print(f"No recommendations to insert for user {user_id}, source {source_image_id}.")
+# Mirrors generate_recommendations_for_pair: navigation candidates minus the source and
+# already-clicked images, boosted by the tags, colors and garment types of the user's liked
+# items, then the top 3 per pair (ties keep navigation path order). Score increments are
+# summed as float8 in the same order as the Python loop, so rankings match it exactly.
+SCORE_RECOMMENDATIONS_SQL = """
+    WITH pairs AS (
+        SELECT p.user_id, p.source_image_id, sm.garment_type AS source_garment_type
+        FROM unnest(%s::text[], %s::text[]) AS p(user_id, source_image_id)
+        JOIN image_metadata sm ON sm.image_id = p.source_image_id
+    ),
+    liked AS (
+        SELECT ui.user_id, im.style_tags, im.dominant_colors, im.garment_type
+        FROM user_interactions ui
+        JOIN image_metadata im USING (image_id)
+        WHERE ui.clicked AND ui.user_id IN (SELECT user_id FROM pairs)
+    ),
+    liked_tags AS (
+        SELECT user_id, tag, count(*) AS n FROM liked, unnest(style_tags) AS tag GROUP BY user_id, tag
+    ),
+    liked_colors AS (
+        SELECT user_id, color, count(*) AS n FROM liked, unnest(dominant_colors) AS color GROUP BY user_id, color
+    ),
+    liked_garments AS (
+        SELECT DISTINCT user_id, garment_type FROM liked WHERE garment_type <> ''
+    ),
+    nav AS (
+        SELECT p.user_id, p.source_image_id, p.source_garment_type, c.image_id, c.base_score, c.ord
+        FROM pairs p
+        JOIN image_navigation_paths np USING (source_image_id)
+        CROSS JOIN LATERAL unnest(np.next_possible_images, np.path_scores) WITH ORDINALITY AS c(image_id, base_score, ord)
+        WHERE c.image_id IS NOT NULL AND c.base_score IS NOT NULL
+          AND c.image_id <> p.source_image_id
+          AND NOT EXISTS (
+              SELECT 1 FROM user_interactions ui
+              WHERE ui.user_id = p.user_id AND ui.clicked AND ui.image_id = c.image_id
+          )
+    ),
+    score_terms AS (
+        -- One row per score increment, numbered in the order the Python loop applies them
+        SELECT n.user_id, n.source_image_id, n.image_id, 0 AS step, 0::bigint AS pos, n.base_score AS term, NULL::text COLLATE "C" AS reason
+        FROM nav n
+        UNION ALL
+        SELECT n.user_id, n.source_image_id, n.image_id, 1, t.pos, 0.1::float8 * lt.n,
+               'You previously liked items with similar ''' || lt.tag || ''' style.'
+        FROM nav n
+        JOIN image_metadata cm ON cm.image_id = n.image_id
+        CROSS JOIN LATERAL unnest(cm.style_tags) WITH ORDINALITY AS t(tag, pos)
+        JOIN liked_tags lt ON lt.user_id = n.user_id AND lt.tag = t.tag
+        UNION ALL
+        SELECT n.user_id, n.source_image_id, n.image_id, 2, c.pos, 0.05::float8 * lc.n,
+               'You previously liked items with similar ''' || lc.color || ''' color.'
+        FROM nav n
+        JOIN image_metadata cm ON cm.image_id = n.image_id
+        CROSS JOIN LATERAL unnest(cm.dominant_colors) WITH ORDINALITY AS c(color, pos)
+        JOIN liked_colors lc ON lc.user_id = n.user_id AND lc.color = c.color
+        UNION ALL
+        SELECT n.user_id, n.source_image_id, n.image_id, 3, 0, 0.2::float8,
+               'You previously liked ''' || cm.garment_type || ''' type items.'
+        FROM nav n
+        JOIN image_metadata cm ON cm.image_id = n.image_id
+        JOIN liked_garments lg ON lg.user_id = n.user_id AND lg.garment_type = cm.garment_type
+        WHERE cm.garment_type IS DISTINCT FROM n.source_garment_type
+    ),
+    scored AS (
+        SELECT user_id, source_image_id, image_id,
+               sum(term ORDER BY step, pos) AS score,
+               array_agg(DISTINCT reason ORDER BY reason) FILTER (WHERE reason IS NOT NULL) AS reasons
+        FROM score_terms
+        GROUP BY user_id, source_image_id, image_id
+    ),
+    ranked AS (
+        SELECT s.user_id, s.source_image_id, s.image_id,
+               row_number() OVER (PARTITION BY s.user_id, s.source_image_id ORDER BY s.score DESC, n.ord) AS rank,
+               array_to_string(coalesce(s.reasons, ARRAY['This item complements your current selection.']), '. ') AS reasons
+        FROM scored s
+        JOIN nav n USING (user_id, source_image_id, image_id)
+    )
+    SELECT user_id, source_image_id, array_agg(image_id ORDER BY rank), array_agg(reasons ORDER BY rank)
+    FROM ranked
+    WHERE rank <= 3
+    GROUP BY user_id, source_image_id;
+"""
+
+def score_recommendations_in_db(conn, input_pairs):
+    """
+    Generates recommendations for all (user_id, source_image_id) pairs with one SQL statement.
+    Returns a dictionary {(user_id, source_image_id): (recommended_ids, reasons)}; pairs
+    without candidates are absent.
+    """
+    if not input_pairs:
+        return {}
+    user_ids = [user_id for user_id, _ in input_pairs]
+    source_ids = [source_id for _, source_id in input_pairs]
+    try:
+        with conn.cursor() as cur:
+            cur.execute(SCORE_RECOMMENDATIONS_SQL, (user_ids, source_ids))
+            return {(user_id, source_id): (ids, reasons) for user_id, source_id, ids, reasons in cur.fetchall()}
+    except psycopg2.Error as e:
+        print(f"Error scoring recommendations in the database: {e}")
+        conn.rollback()
+        return {}
+
+def _score_chunk_on_pooled_connection(input_pairs):
+    """Runs score_recommendations_in_db for one chunk of pairs on a connection borrowed from the pool."""
+    with db_connection() as conn:
+        if conn is None:
+            return {}
+        try:
+            return score_recommendations_in_db(conn, input_pairs)
+        finally:
+            conn.rollback() # End the read-only transaction before the connection goes back
+
+def score_recommendations_in_db_parallel(conn, input_pairs):
+    """
+    Like score_recommendations_in_db, but splits many pairs into SQL_SCORING_CHUNK_SIZE chunks
+    and scores them concurrently on separate pooled connections, so the server works on
+    several chunks at once. Small inputs use `conn` directly.
+    """
+    chunks = [input_pairs[i:i + SQL_SCORING_CHUNK_SIZE] for i in range(0, len(input_pairs), SQL_SCORING_CHUNK_SIZE)]
+    # The caller already holds one pooled connection
+    workers = min(RECOMMENDATION_WORKERS, len(chunks), max(DB_POOL_MAX_CONN - 1, 1))
+    if workers <= 1:
+        return score_recommendations_in_db(conn, input_pairs)
+
+    recommendations_by_pair = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for chunk_result in executor.map(_score_chunk_on_pooled_connection, chunks):
+            recommendations_by_pair.update(chunk_result)
+    return recommendations_by_pair
+
+def insert_recommendations(conn, recommendation_rows):
+    """
+    Inserts generated recommendations into the recommendations table in one transaction.
+    recommendation_rows is a list of (user_id, source_image_id, recommended_ids, reasons_text) tuples;
+    execute_values sends them as multi-row INSERTs instead of one statement per row. generated_at
+    is filled in by the column's DEFAULT now().
+    """
+    if not recommendation_rows:
+        print("No recommendations to insert.")
         return False
-        
+
     insert_query = sql.SQL("""
-        INSERT INTO recommendations (user_id, source_image_id, recommended_images, reasoning, generated_at)
-        VALUES (%s, %s, %s, %s, %s);
+        INSERT INTO recommendations (user_id, source_image_id, recommended_images, reasoning)
+        VALUES %s;
     """)
     try:
         with conn.cursor() as cur:
-            cur.execute(insert_query, (user_id, source_image_id, recommended_ids, reasons_text, datetime.now()))
+            extras.execute_values(cur, insert_query, recommendation_rows, page_size=500)
         conn.commit()
+        print(f"Saved {len(recommendation_rows)} recommendation sets.")
         return True
     except psycopg2.Error as e:
-        print(f"Error inserting recommendations for user {user_id}, source {source_image_id}: {e}")
+        print(f"Error inserting recommendations: {e}")
         conn.rollback()
         return False
 
@@ -243,14 +573,17 @@ def main():
         return
 
     if not create_tables_if_not_exist(conn): # Ensures 'recommendations' table is created
-        conn.close()
+        release_db_connection(conn)
         return
 
+    # Click histories of all target users in one round-trip; the last click of each is the
+    # source image of its pair, so no separate last-clicked query is needed.
+    clicked_history_by_user = get_clicked_history_batch(conn, TARGET_USER_IDS)
+
     # Get (user_id, source_image_id) pairs
-    user_source_images = get_last_clicked_image_for_users(conn, TARGET_USER_IDS)
-    
     input_pairs = []
-    for user_id, source_img_id in user_source_images.items():
+    for user_id, history in clicked_history_by_user.items():
+        source_img_id = history[-1] if history else None
         if source_img_id is None:
             print(f"User {user_id} has no clicked items. Assigning a random image as source.")
             source_img_id = get_random_image(conn)
@@ -261,30 +594,50 @@ def main():
 
     if not input_pairs:
         print("No (user, source_image) pairs to process. Exiting.")
-        conn.close()
+        release_db_connection(conn)
         return
         
     print(f"Generating recommendations for {len(input_pairs)} user/source image pairs: {input_pairs}")
 
-    # Cache for image metadata to reduce DB queries
-    all_metadata_cache = {} 
+    if RECOMMENDATION_SCORING == "sql":
+        # Candidate filtering, boosting and top-3 selection run server-side in one statement
+        recommendations_by_pair = score_recommendations_in_db_parallel(conn, input_pairs)
+    else:
+        recommendations_by_pair = None
+        # Navigation paths of all source images, likewise in a single query
+        navigation_paths = get_navigation_paths_batch(conn, list({source_id for _, source_id in input_pairs}))
+
+        # Metadata of every image any pair needs (sources, liked history, navigation candidates), fetched once
+        needed_image_ids = {source_id for _, source_id in input_pairs}
+        for history in clicked_history_by_user.values():
+            needed_image_ids.update(history)
+        for nav_candidates, _ in navigation_paths.values():
+            needed_image_ids.update(nav_candidates)
+        all_metadata_cache = get_image_metadata_batch(conn, list(needed_image_ids))
 
+    recommendation_rows = [] # Collected across pairs and inserted in one batch at the end
     for user_id, source_image_id in input_pairs:
         print(f"\nProcessing: User '{user_id}', Source Image '{source_image_id}'")
         
-        recommended_ids, reasons = generate_recommendations_for_pair(conn, user_id, source_image_id, all_metadata_cache)
+        if recommendations_by_pair is not None:
+            recommended_ids, reasons = recommendations_by_pair.get((user_id, source_image_id), ([], []))
+        else:
+            recommended_ids, reasons = generate_recommendations_for_pair(
+                user_id, source_image_id, all_metadata_cache,
+                clicked_history_by_user[user_id], navigation_paths[source_image_id]
+            )
         
         if recommended_ids:
             print(f"  Recommendations for {user_id} (based on {source_image_id}):")
             for i, img_id in enumerate(recommended_ids):
                 print(f"    - {img_id}: {reasons[i]}")
-            insert_recommendations(conn, user_id, source_image_id, recommended_ids, reasons)
+            recommendation_rows.append((user_id, source_image_id, recommended_ids, reasons))
         else:
             print(f"  No recommendations generated for {user_id} based on {source_image_id}.")
-            
-    conn.close()
+
+    insert_recommendations(conn, recommendation_rows)
+    release_db_connection(conn)
     print("\nRecommendation engine process completed.")
 
 if __name__ == "__main__":
-    from datetime import datetime # Ensure datetime is available for direct script run.
     main()
@@ -1,7 +1,14 @@
 import os
+import numpy as np
 import psycopg2
 from psycopg2 import sql, extras
 import random
+from db_schema import ensure_schema
+
+try:
+    from numba import njit, prange # Optional: compiled pairwise scoring kernel
+except ImportError:
+    njit = None
 
 # Database connection details from environment variables
 DB_HOST = os.environ.get("DB_HOST", "localhost")
@@ -9,8 +16,14 @@ DB_NAME = os.environ.get("DB_NAME", "fashion_db")
 DB_USER = os.environ.get("DB_USER", "postgres") # Default user for postgres image
 DB_PASSWORD = os.environ.get("DB_PASSWORD", "postgres") # Default password for postgres image
 
-PRIMARY_GARMENT_TYPES = ["t-shirt", "shorts", "dress", "skirt", "swimsuit"] # Main clothing items
-ACCESSORY_GARMENT_TYPES = ["sunglasses", "hat", "belt", "bag", "watch", "sandals"] # Accessories
+# frozensets, so the garment role checks are O(1) hash lookups
+PRIMARY_GARMENT_TYPES = frozenset({"t-shirt", "shorts", "dress", "skirt", "swimsuit"}) # Main clothing items
+ACCESSORY_GARMENT_TYPES = frozenset({"sunglasses", "hat", "belt", "bag", "watch", "sandals"}) # Accessories
+
+# Rows fetched per round-trip when streaming image metadata from the server-side cursor
+FETCH_ITERSIZE = 10000
+# Source images scored per vectorized block; bounds the (block x N) score matrices in memory
+SIMILARITY_BLOCK_ROWS = 1024
 
 def get_db_connection():
     """Establishes a connection to the PostgreSQL database."""
@@ -26,10 +39,8 @@ def get_db_connection():
 def create_tables_if_not_exist(conn):
     """Creates tables from schema.sql if they don't exist."""
     try:
-        with open("schema.sql", "r") as f:
-            schema_sql = f.read()
         with conn.cursor() as cur:
-            cur.execute(schema_sql)
+            ensure_schema(cur)
         conn.commit()
         print("Tables from schema.sql checked/created successfully.")
     except (FileNotFoundError, psycopg2.Error) as e:
@@ -39,18 +50,38 @@ def create_tables_if_not_exist(conn):
     return True
 
 def fetch_image_metadata(conn):
-    """Fetches all image metadata from the image_metadata table."""
+    """
+    Fetches all image metadata from the image_metadata table in column-oriented form:
+    {column_name: [value per image]}, with images ordered by image_id. Rows are streamed
+    through a server-side (named) cursor in batches of FETCH_ITERSIZE and appended to the
+    column lists, so neither side ever holds the whole table as one value and no per-row
+    dictionaries are built. Returns {} if there is no metadata.
+    """
+    image_columns = {"image_id": [], "style_tags": [], "garment_type": [], "accessories": [], "gender": []}
+    image_ids, style_tags, garment_types, accessories, genders = image_columns.values()
     try:
-        with conn.cursor(cursor_factory=extras.DictCursor) as cur:
-            cur.execute("SELECT image_id, style_tags, garment_type, accessories, gender FROM image_metadata;")
-            records = cur.fetchall()
-            if not records:
-                print("No image metadata found in the database. Run ETL script first.")
-                return []
-            return [dict(record) for record in records]
+        with conn.cursor(name="image_metadata_stream") as cur:
+            cur.itersize = FETCH_ITERSIZE
+            cur.execute("SELECT image_id, style_tags, garment_type, accessories, gender FROM image_metadata ORDER BY image_id;")
+            for image_id, tags, garment_type, items, gender in cur:
+                image_ids.append(image_id)
+                style_tags.append(tags or [])
+                garment_types.append(garment_type)
+                accessories.append(items or [])
+                genders.append(gender)
+        conn.commit() # Close the transaction the named cursor ran in
     except psycopg2.Error as e:
         print(f"Error fetching image metadata: {e}")
-        return []
+        conn.rollback()
+        return {}
+    if not image_ids:
+        print("No image metadata found in the database. Run ETL script first.")
+        return {}
+    return image_columns
+
+def image_record(image_columns, index):
+    """Returns one image's metadata as a dictionary, from column-oriented metadata."""
+    return {column: values[index] for column, values in image_columns.items()}
 
 def calculate_similarity_score(source_image, candidate_image, all_images_map):
     """Calculates a similarity score between two images based on defined rules."""
@@ -91,52 +122,201 @@ def calculate_similarity_score(source_image, candidate_image, all_images_map):
     return min(score, 1.0), reasons
 
 
-def generate_navigation_paths(all_images_metadata):
-    """Generates navigation paths for each image."""
+def build_similarity_arrays(image_columns):
+    """
+    Encodes column-oriented image metadata (see fetch_image_metadata) as arrays with one row per image, for vectorized scoring: style tags
+    as bitmasks (64 tags per uint64 word) and in CSR form, garment type ids, and primary/accessory masks.
+    """
+    tag_index = {}
+    for tags in image_columns['style_tags']:
+        for tag in tags or []:
+            tag_index.setdefault(tag, len(tag_index))
+
+    # Sorted, de-duplicated tag columns per image (set semantics: repeated tags count once)
+    tag_rows = [sorted({tag_index[tag] for tag in tags or []}) for tags in image_columns['style_tags']]
+
+    n_words = max(1, (len(tag_index) + 63) // 64)
+    row_masks = [sum(1 << col for col in row) for row in tag_rows]
+    tag_masks = np.array(
+        [[(mask >> (64 * word)) & 0xFFFFFFFFFFFFFFFF for word in range(n_words)] for mask in row_masks],
+        dtype=np.uint64
+    ).reshape(len(tag_rows), n_words)
+
+    # The same tags in CSR form for the numba kernel
+    tag_indptr = np.zeros(len(tag_rows) + 1, dtype=np.int64)
+    tag_indptr[1:] = np.cumsum([len(row) for row in tag_rows])
+    tag_indices = np.array([col for row in tag_rows for col in row], dtype=np.int64)
+
+    garment_types = image_columns['garment_type']
+    garment_index = {}
+    garment_ids = np.array([garment_index.setdefault(g, len(garment_index)) for g in garment_types], dtype=np.int32)
+    return {
+        "tag_masks": tag_masks,
+        "tag_indptr": tag_indptr,
+        "tag_indices": tag_indices,
+        "garment_ids": garment_ids,
+        # Tag column of each image's garment type (-1 if no image has it as a style tag)
+        "garment_tag_cols": np.array([tag_index.get(g, -1) for g in garment_types], dtype=np.int64),
+        "is_primary": np.array([g in PRIMARY_GARMENT_TYPES for g in garment_types], dtype=bool),
+        "is_accessory": np.array([g in ACCESSORY_GARMENT_TYPES for g in garment_types], dtype=bool),
+    }
+
+def _popcount(words):
+    """Number of set bits in each element of a uint64 array (same shape, no per-bit temporaries)."""
+    if hasattr(np, "bitwise_count"): # NumPy >= 2.0
+        return np.bitwise_count(words)
+    # SWAR popcount: bit counts of 2-, 4- then 8-bit fields, summed into the top byte by the multiply
+    words = words - ((words >> np.uint64(1)) & np.uint64(0x5555555555555555))
+    words = (words & np.uint64(0x3333333333333333)) + ((words >> np.uint64(2)) & np.uint64(0x3333333333333333))
+    words = (words + (words >> np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    return ((words * np.uint64(0x0101010101010101)) >> np.uint64(56)).astype(np.uint8)
+
+def shared_tag_counts(arrays, rows):
+    """
+    Number of distinct style tags each source image in `rows` shares with every image, as (len(rows), N).
+    Counts are accumulated one mask word at a time, so temporaries stay (len(rows), N).
+    """
+    tag_masks = arrays["tag_masks"]
+    source_masks = tag_masks[rows]
+    counts = np.zeros((len(source_masks), len(tag_masks)), dtype=np.int32)
+    for word in range(tag_masks.shape[1]):
+        counts += _popcount(source_masks[:, word, None] & tag_masks[None, :, word])
+    return counts
+
+def score_similarity_block(arrays, rows):
+    """
+    Vectorized calculate_similarity_score: scores of the source images `rows` against every
+    image, as a (len(rows), N) float64 matrix. Terms are added in the same order as
+    calculate_similarity_score, so the values match it exactly.
+    """
+    # Rule 1: Shared Tags or Garment Type
+    scores = 0.1 * shared_tag_counts(arrays, rows)
+    garment_ids = arrays["garment_ids"]
+    same_garment = garment_ids[rows, None] == garment_ids[None, :]
+    garment_in_source_tags = np.zeros_like(same_garment)
+    garment_cols = arrays["garment_tag_cols"]
+    has_tag_col = garment_cols >= 0
+    cols = garment_cols[has_tag_col]
+    source_words = arrays["tag_masks"][rows][:, cols // 64]
+    garment_in_source_tags[:, has_tag_col] = (source_words >> (cols % 64).astype(np.uint64)) & np.uint64(1) == 1
+    scores += np.where(same_garment, 0.2, np.where(garment_in_source_tags, 0.1, 0.0))
+
+    # Rule 2: Accessory Complementarity, as outer products of the role masks (sources x candidates)
+    is_primary, is_accessory = arrays["is_primary"], arrays["is_accessory"]
+    complement = np.outer(is_primary[rows], is_accessory) | np.outer(is_accessory[rows], is_primary)
+    scores += 0.25 * complement
+
+    return np.minimum(scores, 1.0)
+
+if njit is not None:
+    @njit(parallel=True, cache=True)
+    def _top_similar_kernel(tag_indptr, tag_indices, garment_ids, garment_tag_cols, is_primary, is_accessory, k, threshold):
+        """
+        Compiled counterpart of score_similarity_block plus top-k selection, one source image per
+        parallel iteration. Returns (N, k) candidate indices (-1 = empty slot) and scores.
+        """
+        n = garment_ids.shape[0]
+        out_ids = np.full((n, k), -1, dtype=np.int64)
+        out_scores = np.full((n, k), -np.inf)
+        for i in prange(n):
+            src_start, src_end = tag_indptr[i], tag_indptr[i + 1]
+            for j in range(n):
+                if j == i:
+                    continue
+                # Rule 1: Shared Tags (merge of two sorted index lists) or Garment Type
+                shared = 0
+                a, b = src_start, tag_indptr[j]
+                b_end = tag_indptr[j + 1]
+                while a < src_end and b < b_end:
+                    if tag_indices[a] == tag_indices[b]:
+                        shared += 1
+                        a += 1
+                        b += 1
+                    elif tag_indices[a] < tag_indices[b]:
+                        a += 1
+                    else:
+                        b += 1
+                score = 0.1 * shared
+                if garment_ids[i] == garment_ids[j]:
+                    score += 0.2
+                elif garment_tag_cols[j] >= 0:
+                    for a in range(src_start, src_end):
+                        if tag_indices[a] == garment_tag_cols[j]:
+                            score += 0.1
+                            break
+                # Rule 2: Accessory Complementarity
+                if (is_primary[i] and is_accessory[j]) or (is_accessory[i] and is_primary[j]):
+                    score += 0.25
+                score = min(score, 1.0)
+
+                # Insert into the row's descending top-k; on ties the earlier candidate stays ahead
+                if score <= threshold or score <= out_scores[i, k - 1]:
+                    continue
+                pos = k - 1
+                while pos > 0 and out_scores[i, pos - 1] < score:
+                    out_scores[i, pos] = out_scores[i, pos - 1]
+                    out_ids[i, pos] = out_ids[i, pos - 1]
+                    pos -= 1
+                out_scores[i, pos] = score
+                out_ids[i, pos] = j
+        return out_ids, out_scores
+else:
+    _top_similar_kernel = None
+
+def top_similar_images(arrays, k=5, threshold=0.1):
+    """
+    Returns, for every image in `arrays` (see build_similarity_arrays), up to k
+    (candidate_index, score) pairs of the other images scoring above threshold, best first (ties keep metadata order). Uses the numba kernel
+    when numba is installed, otherwise blocked NumPy matrix scoring.
+    """
+    n = len(arrays["garment_ids"])
+    if _top_similar_kernel is not None and n > 0:
+        best, best_scores = _top_similar_kernel(
+            arrays["tag_indptr"], arrays["tag_indices"], arrays["garment_ids"], arrays["garment_tag_cols"],
+            arrays["is_primary"], arrays["is_accessory"], k, threshold
+        )
+        return [
+            [(j, score) for j, score in zip(cand_indices, cand_scores) if j >= 0]
+            for cand_indices, cand_scores in zip(best.tolist(), best_scores.tolist())
+        ]
+
+    top_candidates = []
+    for block_start in range(0, n, SIMILARITY_BLOCK_ROWS):
+        rows = np.arange(block_start, min(block_start + SIMILARITY_BLOCK_ROWS, n))
+        scores = score_similarity_block(arrays, rows)
+        scores[np.arange(len(rows)), rows] = -np.inf # Never pair an image with itself
+        best = np.argsort(-scores, axis=1, kind="stable")[:, :k]
+        best_scores = np.take_along_axis(scores, best, axis=1)
+        for cand_indices, cand_scores in zip(best.tolist(), best_scores.tolist()):
+            top_candidates.append([(j, score) for j, score in zip(cand_indices, cand_scores) if score > threshold])
+    return top_candidates
+
+def generate_navigation_paths(image_columns):
+    """Generates navigation paths for each image from column-oriented metadata (see fetch_image_metadata)."""
     navigation_paths = []
-    all_images_map = {img['image_id']: img for img in all_images_metadata}
-
-    for source_image in all_images_metadata:
-        potential_candidates = []
-        for candidate_image_metadata in all_images_metadata:
-            if source_image['image_id'] == candidate_image_metadata['image_id']:
-                continue
-
-            score, _ = calculate_similarity_score(source_image, candidate_image_metadata, all_images_map)
-            if score > 0.1: # Basic threshold to consider a candidate
-                potential_candidates.append({
-                    "image_id": candidate_image_metadata['image_id'],
-                    "score": score,
-                    "gender": candidate_image_metadata['gender'], # for style variation rule
-                    "style_tags": candidate_image_metadata['style_tags'] # for style variation rule
-                })
-        
-        # Sort candidates by score
-        potential_candidates.sort(key=lambda x: x['score'], reverse=True)
-        
-        selected_next_images = []
-        selected_scores = []
-        
-        # Select top 3-5 candidates
-        count = 0
-        for cand in potential_candidates:
-            if count < 5: # Max 5 suggestions
-                if cand['image_id'] not in [img['image_id'] for img in selected_next_images]: # ensure distinct
-                    selected_next_images.append(cand)
-                    count +=1
-            else:
-                break
+    image_ids = image_columns['image_id']
+    genders = image_columns['gender']
+
+    # Pairwise scoring runs as NumPy matrix operations; top 5 candidates per source image
+    arrays = build_similarity_arrays(image_columns)
+    top_candidates = top_similar_images(arrays, k=5, threshold=0.1)
+
+    for source_index, candidates in enumerate(top_candidates):
+        source_image_id = image_ids[source_index]
+        selected_next_images = [{"index": j, "image_id": image_ids[j], "score": score} for j, score in candidates]
+        selected_ids = {img['image_id'] for img in selected_next_images} # O(1) membership for the loop below
         
         # Try to apply Style Variation if less than 3 candidates or to add diversity
         if len(selected_next_images) < 3 or random.random() < 0.2: # 20% chance to try style variation
-            for candidate_image_metadata in all_images_metadata:
-                if source_image['image_id'] == candidate_image_metadata['image_id'] or \
-                   candidate_image_metadata['image_id'] in [img['image_id'] for img in selected_next_images]:
+            # Shared tag counts with every image from one bitmask AND + popcount
+            source_shared_counts = shared_tag_counts(arrays, [source_index])[0].tolist()
+            for candidate_index, candidate_image_id in enumerate(image_ids):
+                if candidate_index == source_index or candidate_image_id in selected_ids:
                     continue
 
-                shared_style_tags = set(source_image['style_tags']) & set(candidate_image_metadata['style_tags'])
-                if source_image['gender'] != candidate_image_metadata['gender'] and len(shared_style_tags) >= 2:
-                    variation_score = 0.1 + 0.1 * len(shared_style_tags) # Base score for style variation
+                shared_count = source_shared_counts[candidate_index]
+                if genders[source_index] != genders[candidate_index] and shared_count >= 2:
+                    variation_score = 0.1 + 0.1 * shared_count # Base score for style variation
                     
                     # Check if it's already selected or if we can add/replace with it
                     can_add_variation = True
@@ -149,17 +329,19 @@ def generate_navigation_paths(all_images_metadata):
                                 lowest_score_idx = idx
                         if variation_score > min_score :
                              # Check if this variation candidate is not already there with a different score logic
-                            if not any(c['image_id'] == candidate_image_metadata['image_id'] for c in selected_next_images):
-                                selected_next_images.pop(lowest_score_idx)
+                            if candidate_image_id not in selected_ids:
+                                selected_ids.discard(selected_next_images.pop(lowest_score_idx)['image_id'])
                             else: # already there, maybe update score if this path is stronger (unlikely here)
                                 can_add_variation = False
 
                         else: # variation score not high enough to replace
                             can_add_variation = False
                     
-                    if can_add_variation and not any(c['image_id'] == candidate_image_metadata['image_id'] for c in selected_next_images):
+                    if can_add_variation and candidate_image_id not in selected_ids:
+                         selected_ids.add(candidate_image_id)
                          selected_next_images.append({
-                            "image_id": candidate_image_metadata['image_id'],
+                            "index": candidate_index,
+                            "image_id": candidate_image_id,
                             "score": min(variation_score, 1.0),
                             "reason_extra": "Style variation (different gender, similar tags)"
                         })
@@ -177,16 +359,17 @@ def generate_navigation_paths(all_images_metadata):
             general_reason = "Path generated based on shared styles, garment types, and accessory complementarity."
             if final_selected_images:
                 top_candidate_id = final_selected_images[0]['image_id']
-                top_candidate_meta = all_images_map[top_candidate_id]
-                _, top_reasons = calculate_similarity_score(source_image, top_candidate_meta, all_images_map)
+                top_candidate_meta = image_record(image_columns, final_selected_images[0]['index'])
+                source_image = image_record(image_columns, source_index)
+                _, top_reasons = calculate_similarity_score(source_image, top_candidate_meta, None)
                 if "reason_extra" in final_selected_images[0]:
                     top_reasons.append(final_selected_images[0]['reason_extra'])
 
                 if top_reasons:
-                    general_reason = f"Primary Link: {source_image['image_id']} to {top_candidate_id} - Reasons: {'; '.join(top_reasons)}. Other suggestions follow similar logic."
+                    general_reason = f"Primary Link: {source_image_id} to {top_candidate_id} - Reasons: {'; '.join(top_reasons)}. Other suggestions follow similar logic."
             
             navigation_paths.append({
-                "source_image_id": source_image['image_id'],
+                "source_image_id": source_image_id,
                 "next_possible_images": path_image_ids,
                 "path_scores": path_scores,
                 "reason": general_reason
@@ -203,9 +386,7 @@ def insert_navigation_paths(conn, navigation_paths_data):
     insert_query = """
         INSERT INTO image_navigation_paths (
             source_image_id, next_possible_images, path_scores, reason
-        ) VALUES (
-            %(source_image_id)s, %(next_possible_images)s, %(path_scores)s, %(reason)s
-        )
+        ) VALUES %s
         ON CONFLICT (source_image_id) DO UPDATE SET
             next_possible_images = EXCLUDED.next_possible_images,
             path_scores = EXCLUDED.path_scores,
@@ -214,7 +395,12 @@ def insert_navigation_paths(conn, navigation_paths_data):
     """
     try:
         with conn.cursor() as cur:
-            extras.execute_batch(cur, insert_query, navigation_paths_data)
+            # execute_values folds up to page_size rows into each multi-row INSERT
+            extras.execute_values(
+                cur, insert_query, navigation_paths_data,
+                template="(%(source_image_id)s, %(next_possible_images)s, %(path_scores)s, %(reason)s)",
+                page_size=500
+            )
         conn.commit()
         print(f"Successfully inserted/updated {len(navigation_paths_data)} navigation paths.")
         return len(navigation_paths_data)
@@ -247,7 +433,7 @@ def main():
         conn.close()
         return
     
-    print(f"Fetched {len(all_metadata)} image metadata records.")
+    print(f"Fetched {len(all_metadata['image_id'])} image metadata records.")
 
     navigation_paths = generate_navigation_paths(all_metadata)
     if not navigation_paths:
@@ -0,0 +1,73 @@
+-- Server-side version of user_simulator.simulate_user_sessions (used with SIMULATION_MODE=sql).
+-- Follows the same session model: a random entry click, then per step an 85% chance to follow
+-- the navigation path of the current image (70% click rate) or a random skip (50% click rate).
+CREATE OR REPLACE PROCEDURE simulate_sessions(
+    user_ids TEXT[],
+    min_session_length INT,
+    max_session_length INT,
+    INOUT interactions_recorded INT DEFAULT 0
+)
+LANGUAGE plpgsql AS $$
+DECLARE
+    image_ids TEXT[];
+    num_images INT;
+    sim_user_id TEXT;
+    session_length INT;
+    current_image_id TEXT;
+    next_images TEXT[];
+    viewed_image_id TEXT;
+    was_clicked BOOLEAN;
+    -- Each interaction is a microsecond after the previous one, keeping the click order
+    ts TIMESTAMP := localtimestamp;
+BEGIN
+    interactions_recorded := 0;
+    -- Image ids are aggregated into one array per call; every random draw is an index into it,
+    -- so no temp table or per-draw count(*) is needed
+    SELECT array_agg(image_id) INTO image_ids FROM image_metadata;
+    num_images := coalesce(array_length(image_ids, 1), 0);
+    IF num_images = 0 THEN
+        RETURN;
+    END IF;
+
+    FOREACH sim_user_id IN ARRAY user_ids LOOP
+        session_length := min_session_length + floor(random() * (max_session_length - min_session_length + 1))::INT;
+
+        -- Entry point: a random image, always clicked
+        current_image_id := image_ids[1 + floor(random() * num_images)::INT];
+        INSERT INTO user_interactions (user_id, image_id, clicked, timestamp)
+        VALUES (sim_user_id, current_image_id, TRUE, ts);
+        ts := ts + interval '1 microsecond';
+
+        FOR step IN 2..session_length LOOP
+            next_images := NULL;
+            IF random() < 0.85 THEN -- 85% chance to follow path
+                -- Ids missing from image_metadata are dropped; their rows would fail the FK
+                SELECT array_agg(n.image_id) INTO next_images
+                FROM image_navigation_paths p
+                CROSS JOIN LATERAL unnest(p.next_possible_images) AS n(image_id)
+                JOIN image_metadata m ON m.image_id = n.image_id
+                WHERE p.source_image_id = current_image_id;
+            END IF;
+
+            IF coalesce(array_length(next_images, 1), 0) > 0 THEN
+                viewed_image_id := next_images[1 + floor(random() * array_length(next_images, 1))::INT];
+                was_clicked := random() < 0.70; -- 70% chance to click
+                INSERT INTO user_interactions (user_id, image_id, clicked, timestamp)
+                VALUES (sim_user_id, viewed_image_id, was_clicked, ts);
+                IF was_clicked THEN
+                    current_image_id := viewed_image_id;
+                ELSE
+                    current_image_id := image_ids[1 + floor(random() * num_images)::INT]; -- "bounce" to a random image
+                END IF;
+            ELSE -- Random skip, or no path available from the current image
+                current_image_id := image_ids[1 + floor(random() * num_images)::INT];
+                INSERT INTO user_interactions (user_id, image_id, clicked, timestamp)
+                VALUES (sim_user_id, current_image_id, random() < 0.50, ts); -- 50% chance to click
+            END IF;
+            ts := ts + interval '1 microsecond';
+        END LOOP;
+
+        interactions_recorded := interactions_recorded + session_length;
+    END LOOP;
+END;
+$$;
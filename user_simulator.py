@@ -1,8 +1,20 @@
 import os
+import io
+import csv
+import numpy as np
+import asyncio
+import threading
 import psycopg2
-from psycopg2 import sql, extras
-import random
-from datetime import datetime
+from psycopg2 import extras, pool
+import itertools
+from contextlib import contextmanager
+from db_schema import ensure_schema, read_sql_file
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+try:
+    import asyncpg # Optional: asyncio driver for writing interaction batches
+except ImportError:
+    asyncpg = None
 
 # Database connection details from environment variables
 DB_HOST = os.environ.get("DB_HOST", "localhost")
@@ -11,23 +23,75 @@ DB_USER = os.environ.get("DB_USER", "postgres")
 DB_PASSWORD = os.environ.get("DB_PASSWORD", "postgres")
 
 USER_IDS = [f"user{i:03d}" for i in range(1, 16)] # user001 to user015
+MIN_SESSION_LENGTH = 3
+MAX_SESSION_LENGTH = 7
+
+# Seed for the session random generator; set to an int to make simulations reproducible
+SIMULATION_SEED = None
+
+# Buffered interactions are flushed once at least this many are pending (gains plateau beyond ~1000 rows per INSERT)
+INTERACTION_FLUSH_SIZE = 1000
+# Batches of at least this many rows are streamed with COPY; smaller ones use a multi-row INSERT
+COPY_MIN_ROWS = 100
+# Rows per round trip when streaming image ids and navigation paths from server-side cursors
+FETCH_ITERSIZE = 10000
+# When a simulation produces several flush batches, up to this many are written concurrently,
+# each on its own pooled connection and in its own transaction
+SIMULATION_WORKERS = int(os.environ.get("SIMULATION_WORKERS", "4"))
+# Where sessions are generated: "python" (default) or "sql" to run the whole simulation
+# server-side with the simulate_sessions procedure from simulate_sessions.sql
+SIMULATION_MODE = os.environ.get("SIMULATION_MODE", "python").lower()
+# Driver used to write interaction batches: "psycopg2" (default) or "asyncpg", which writes
+# every batch concurrently over an asyncpg pool (falls back to psycopg2 when not installed)
+SIMULATION_DRIVER = os.environ.get("SIMULATION_DRIVER", "psycopg2").lower()
+
+# Connection pool bounds; connections are opened lazily and reused across calls
+DB_POOL_MIN_CONN = int(os.environ.get("DB_POOL_MIN_CONN", "1"))
+DB_POOL_MAX_CONN = int(os.environ.get("DB_POOL_MAX_CONN", "8"))
+
+_POOL = None
+_POOL_LOCK = threading.Lock()
+
+def _get_pool():
+    """Returns the shared connection pool, creating it on first use."""
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            _POOL = pool.ThreadedConnectionPool(
+                DB_POOL_MIN_CONN, DB_POOL_MAX_CONN,
+                host=DB_HOST, dbname=DB_NAME, user=DB_USER, password=DB_PASSWORD
+            )
+    return _POOL
 
 def get_db_connection():
-    """Establishes a connection to the PostgreSQL database."""
+    """Borrows a connection to the PostgreSQL database from the shared pool."""
     try:
-        conn = psycopg2.connect(host=DB_HOST, dbname=DB_NAME, user=DB_USER, password=DB_PASSWORD)
-        return conn
-    except psycopg2.OperationalError as e:
+        return _get_pool().getconn()
+    except (psycopg2.OperationalError, pool.PoolError) as e:
         print(f"Error connecting to the database: {e}")
         return None
 
+def release_db_connection(conn):
+    """Returns a borrowed connection to the pool (an open transaction is rolled back)."""
+    if _POOL is not None and conn is not None:
+        _POOL.putconn(conn)
+
+@contextmanager
+def db_connection():
+    """Borrows a pooled connection for the duration of a with-block (yields None if unavailable)."""
+    conn = get_db_connection()
+    try:
+        yield conn
+    finally:
+        release_db_connection(conn)
+
+_SIMULATION_PROCEDURE_SQL = read_sql_file("simulate_sessions.sql") # Read once at import, like schema.sql
+
 def create_tables_if_not_exist(conn):
     """Creates tables from schema.sql if they don't exist."""
     try:
-        with open("schema.sql", "r") as f:
-            schema_sql = f.read()
         with conn.cursor() as cur:
-            cur.execute(schema_sql)
+            ensure_schema(cur)
         conn.commit()
         print("Tables from schema.sql checked/created successfully.")
     except (FileNotFoundError, psycopg2.Error) as e:
@@ -39,47 +103,140 @@ def create_tables_if_not_exist(conn):
 def fetch_all_image_ids(conn):
     """Fetches all image_ids from the image_metadata table."""
     try:
-        with conn.cursor() as cur:
+        # Server-side cursor: rows arrive FETCH_ITERSIZE at a time instead of all at once
+        with conn.cursor(name="all_image_ids_cur") as cur:
+            cur.itersize = FETCH_ITERSIZE
             cur.execute("SELECT image_id FROM image_metadata;")
-            records = cur.fetchall()
-            if not records:
-                print("No image_ids found in image_metadata. Run ETL script first.")
-                return []
-            return [record[0] for record in records]
+            image_ids = [record[0] for record in cur]
+        if not image_ids:
+            print("No image_ids found in image_metadata. Run ETL script first.")
+        return image_ids
     except psycopg2.Error as e:
         print(f"Error fetching all image_ids: {e}")
+        conn.rollback()
         return []
 
 def fetch_navigation_paths(conn):
-    """Fetches navigation paths and stores them in a dictionary."""
-    paths = {}
+    """Fetches navigation paths into a dictionary of source_image_id -> tuple of next images."""
     try:
-        with conn.cursor(cursor_factory=extras.DictCursor) as cur:
+        with conn.cursor(name="nav_paths_cur") as cur:
+            cur.itersize = FETCH_ITERSIZE
             cur.execute("SELECT source_image_id, next_possible_images FROM image_navigation_paths WHERE next_possible_images IS NOT NULL AND array_length(next_possible_images, 1) > 0;")
-            records = cur.fetchall()
-            if not records:
-                print("No navigation paths found. Run semantic_enrichment.py first.")
-                return {}
-            for record in records:
-                paths[record['source_image_id']] = record['next_possible_images']
-            return paths
+            paths = {source_image_id: tuple(next_images) for source_image_id, next_images in cur}
+        if not paths:
+            print("No navigation paths found. Run semantic_enrichment.py first.")
+        return paths
     except psycopg2.Error as e:
         print(f"Error fetching navigation paths: {e}")
+        conn.rollback()
         return {}
 
-def insert_user_interaction(conn, user_id, image_id, clicked):
-    """Inserts a single user interaction record."""
-    insert_query = sql.SQL("""
-        INSERT INTO user_interactions (user_id, image_id, clicked, timestamp)
-        VALUES (%s, %s, %s, %s);
-    """)
+# Static statements, passed to psycopg2 as plain strings.
+# Not PREPAREd: each batch is a single statement whose row count varies,
+# so there is no per-row parse/plan cost left to amortize
+INSERT_INTERACTIONS_SQL = "INSERT INTO user_interactions (user_id, image_id, clicked, timestamp) VALUES %s;"
+COPY_INTERACTIONS_SQL = "COPY user_interactions (user_id, image_id, clicked, timestamp) FROM STDIN WITH (FORMAT csv)"
+# asyncpg equivalents (numbered placeholders, COPY column list)
+ASYNCPG_INSERT_INTERACTION_SQL = "INSERT INTO user_interactions (user_id, image_id, clicked, timestamp) VALUES ($1, $2, $3, $4);"
+INTERACTION_COLUMNS = ["user_id", "image_id", "clicked", "timestamp"]
+
+def buffer_user_interaction(buffer, user_id, image_id, clicked, timestamp):
+    """Appends a user interaction record to an in-memory buffer (written by flush_user_interactions)."""
+    # The ids are the shared strings of USER_IDS and all_image_ids, so a row adds no string copies
+    buffer.append((user_id, image_id, clicked, timestamp))
+
+def copy_user_interactions(cur, rows):
+    """Streams interaction rows into user_interactions through COPY FROM STDIN (CSV)."""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for user_id, image_id, clicked, timestamp in rows:
+        writer.writerow((user_id, image_id, clicked, timestamp.isoformat()))
+    buf.seek(0)
+    cur.copy_expert(COPY_INTERACTIONS_SQL, buf)
+
+def flush_user_interactions(conn, buffer):
+    """
+    Writes the buffered interactions inside a savepoint of the caller's transaction:
+    COPY for COPY_MIN_ROWS rows or more, multi-row INSERTs (execute_values) below that.
+    Returns the number of rows written (0 on error, after rolling back to the savepoint);
+    the buffer is emptied either way.
+    """
+    if not buffer:
+        return 0
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SAVEPOINT flush_interactions;")
+            try:
+                if len(buffer) >= COPY_MIN_ROWS:
+                    copy_user_interactions(cur, buffer)
+                else:
+                    extras.execute_values(cur, INSERT_INTERACTIONS_SQL, buffer, template="(%s, %s, %s, %s)", page_size=INTERACTION_FLUSH_SIZE)
+            except psycopg2.Error as e:
+                print(f"Error inserting {len(buffer)} interactions: {e}")
+                cur.execute("ROLLBACK TO SAVEPOINT flush_interactions;")
+                return 0
+            cur.execute("RELEASE SAVEPOINT flush_interactions;")
+        return len(buffer)
+    finally:
+        buffer.clear()
+
+def write_interaction_batch(conn, rows):
+    """
+    Writes a batch of interactions and commits the connection's transaction.
+    The rows are synthetic, so the commit does not wait for the WAL flush.
+    Returns the number of rows written.
+    """
     try:
         with conn.cursor() as cur:
-            cur.execute(insert_query, (user_id, image_id, clicked, datetime.now()))
-        return True
+            cur.execute("SET LOCAL synchronous_commit = off;")
+        written = flush_user_interactions(conn, rows)
+        conn.commit()
+        return written
     except psycopg2.Error as e:
-        print(f"Error inserting interaction for user {user_id}, image {image_id}: {e}")
-        return False
+        print(f"Error writing {len(rows)} interactions: {e}")
+        conn.rollback()
+        return 0
+
+def _write_batch_on_pooled_connection(rows):
+    """Writes one batch on a connection borrowed from the pool (worker for simulate_user_sessions)."""
+    with db_connection() as conn:
+        if conn is None:
+            return 0
+        return write_interaction_batch(conn, rows)
+
+async def _write_batches_asyncpg(batches):
+    """Writes the batches concurrently over an asyncpg pool, one transaction per batch; returns the rows written."""
+    db_pool = await asyncpg.create_pool(
+        host=DB_HOST, database=DB_NAME, user=DB_USER, password=DB_PASSWORD,
+        min_size=min(DB_POOL_MIN_CONN, DB_POOL_MAX_CONN), max_size=DB_POOL_MAX_CONN
+    )
+
+    async def write_batch(rows):
+        try:
+            async with db_pool.acquire() as conn:
+                async with conn.transaction():
+                    await conn.execute("SET LOCAL synchronous_commit = off;")
+                    if len(rows) >= COPY_MIN_ROWS:
+                        await conn.copy_records_to_table("user_interactions", records=rows, columns=INTERACTION_COLUMNS)
+                    else:
+                        await conn.executemany(ASYNCPG_INSERT_INTERACTION_SQL, rows)
+            return len(rows)
+        except asyncpg.PostgresError as e:
+            print(f"Error writing {len(rows)} interactions: {e}")
+            return 0
+
+    try:
+        return sum(await asyncio.gather(*(write_batch(rows) for rows in batches)))
+    finally:
+        await db_pool.close()
+
+def write_interaction_batches_asyncpg(batches):
+    """Writes interaction batches with asyncpg (binary protocol, statements prepared and cached by the driver)."""
+    try:
+        return asyncio.run(_write_batches_asyncpg(batches))
+    except (OSError, asyncpg.PostgresError) as e:
+        print(f"Error writing interactions with asyncpg: {e}")
+        return 0
 
 def simulate_user_sessions(conn, all_image_ids, nav_paths):
     """Simulates user sessions and records interactions."""
@@ -87,62 +244,105 @@ def simulate_user_sessions(conn, all_image_ids, nav_paths):
         print("Cannot simulate sessions: No image IDs available.")
         return
 
-    total_interactions_recorded = 0
+    # Interactions are buffered into batches of at least INTERACTION_FLUSH_SIZE rows;
+    # a batch only ever holds whole sessions
+    batches = []
+    pending = []
     print("Starting user simulation...")
 
-    for user_id in USER_IDS:
+    # Draw every random number for all sessions up front; the loop below only indexes into them
+    rng = np.random.default_rng(SIMULATION_SEED)
+    num_users = len(USER_IDS)
+    session_lengths = rng.integers(MIN_SESSION_LENGTH, MAX_SESSION_LENGTH + 1, size=num_users)
+    action_draws = rng.random((num_users, MAX_SESSION_LENGTH))
+    click_draws = rng.random((num_users, MAX_SESSION_LENGTH))
+    path_draws = rng.random((num_users, MAX_SESSION_LENGTH)) # Scaled by the path length to pick a next image
+    random_image_idx = rng.integers(0, len(all_image_ids), size=(num_users, MAX_SESSION_LENGTH))
+    # One clock read per simulation; each interaction is a microsecond after the previous one,
+    # which keeps the click order within a session for the recommendation engine
+    base_ts = datetime.now()
+    timestamps = (base_ts + timedelta(microseconds=i) for i in itertools.count())
+    # The walk tracks integer indices into all_image_ids; ids are only looked up when buffering a row.
+    # Paths are flattened CSR-style: the next images of image i are nav_flat[nav_offsets[i]:nav_offsets[i + 1]]
+    # (ids missing from image_metadata are dropped; their rows would fail the FK).
+    image_index = {image_id: i for i, image_id in enumerate(all_image_ids)}
+    next_indices = [()] * len(all_image_ids)
+    for source_image_id, next_images in nav_paths.items():
+        if source_image_id in image_index:
+            next_indices[image_index[source_image_id]] = [image_index[n] for n in next_images if n in image_index]
+    nav_flat = [idx for next_idx in next_indices for idx in next_idx]
+    nav_offsets = np.concatenate(([0], np.cumsum([len(next_idx) for next_idx in next_indices]))).tolist()
+
+    for u, user_id in enumerate(USER_IDS):
         print(f"Simulating session for {user_id}...")
-        session_length = random.randint(3, 7)
-        
+        actions, clicks, picks, random_images = action_draws[u].tolist(), click_draws[u].tolist(), path_draws[u].tolist(), random_image_idx[u].tolist()
+
         # Entry point: Select a random image
-        current_image_id = random.choice(all_image_ids)
-        if insert_user_interaction(conn, user_id, current_image_id, True): # First interaction is always a "click"
-            total_interactions_recorded += 1
-        else:
-            conn.rollback() # Rollback this user's transaction if first insert fails
-            continue # Skip to next user if initial interaction fails
-
-        for _ in range(1, session_length): # Remaining interactions in the session
-            action_choice = random.random() # 0.0 to 1.0
-
-            if action_choice < 0.85 and current_image_id in nav_paths: # 85% chance to follow path
-                next_images = nav_paths[current_image_id]
-                if next_images:
-                    viewed_image_id = random.choice(next_images)
-                    clicked = random.random() < 0.70 # 70% chance to click
-                    
-                    if insert_user_interaction(conn, user_id, viewed_image_id, clicked):
-                        total_interactions_recorded += 1
-                    else:
-                        conn.rollback() # Rollback this user's transaction
-                        break # End session for this user on error
+        current_idx = random_images[0]
+        buffer_user_interaction(pending, user_id, all_image_ids[current_idx], True, next(timestamps)) # First interaction is always a "click"
 
-                    if clicked:
-                        current_image_id = viewed_image_id
-                    else:
-                        # User didn't click, they might "bounce" or continue from same image.
-                        # For simplicity, let's say they might pick a random image next (fall through to Random Skip)
-                        # or try to follow path from the *same* current_image_id again.
-                        # To make it more likely to move, let's make them fall to Random Skip.
-                        current_image_id = random.choice(all_image_ids) # Simulates a "bounce" to a new random image
-                else: # No path available from current image
-                    current_image_id = random.choice(all_image_ids)
-                    if insert_user_interaction(conn, user_id, current_image_id, random.random() < 0.50):
-                         total_interactions_recorded +=1
-                    else:
-                        conn.rollback(); break
-            else: # 15% chance for Random Skip or if path following ended/failed
-                current_image_id = random.choice(all_image_ids)
-                clicked = random.random() < 0.50 # 50% chance to click on a random skip
-                if insert_user_interaction(conn, user_id, current_image_id, clicked):
-                    total_interactions_recorded += 1
+        for step in range(1, session_lengths[u]): # Remaining interactions in the session
+            action_choice = actions[step] # 0.0 to 1.0
+            path_start = nav_offsets[current_idx]
+            num_next = nav_offsets[current_idx + 1] - path_start # 0 when the image has no path to follow
+
+            if action_choice < 0.85 and num_next: # 85% chance to follow path
+                viewed_idx = nav_flat[path_start + int(picks[step] * num_next)]
+                clicked = clicks[step] < 0.70 # 70% chance to click
+                buffer_user_interaction(pending, user_id, all_image_ids[viewed_idx], clicked, next(timestamps))
+
+                if clicked:
+                    current_idx = viewed_idx
                 else:
-                    conn.rollback() # Rollback this user's transaction
-                    break # End session for this user on error
+                    # User didn't click, they might "bounce" or continue from same image.
+                    # For simplicity, let's say they might pick a random image next (fall through to Random Skip)
+                    # or try to follow path from the *same* current image again.
+                    # To make it more likely to move, let's make them fall to Random Skip.
+                    current_idx = random_images[step] # Simulates a "bounce" to a new random image
+            else: # 15% chance for Random Skip, or no path available from the current image
+                current_idx = random_images[step]
+                clicked = clicks[step] < 0.50 # 50% chance to click on a random skip
+                buffer_user_interaction(pending, user_id, all_image_ids[current_idx], clicked, next(timestamps))
         
-        conn.commit() # Commit all interactions for this user
+        if len(pending) >= INTERACTION_FLUSH_SIZE:
+            batches.append(pending)
+            pending = []
         print(f"Session for {user_id} completed.")
+    if pending:
+        batches.append(pending)
+
+    use_asyncpg = SIMULATION_DRIVER == "asyncpg"
+    if use_asyncpg and asyncpg is None:
+        print("asyncpg is not installed (pip install asyncpg); writing interactions with psycopg2.")
+        use_asyncpg = False
+
+    if use_asyncpg:
+        total_interactions_recorded = write_interaction_batches_asyncpg(batches) if batches else 0
+    elif len(batches) <= 1:
+        # A single batch is written in one transaction on the caller's connection
+        total_interactions_recorded = sum(write_interaction_batch(conn, rows) for rows in batches)
+    else:
+        # Sessions are independent, so batches are written concurrently on pooled connections
+        with ThreadPoolExecutor(max_workers=min(SIMULATION_WORKERS, len(batches))) as executor:
+            total_interactions_recorded = sum(executor.map(_write_batch_on_pooled_connection, batches))
+    print(f"\nUser simulation completed. Total interactions recorded: {total_interactions_recorded}.")
 
+def simulate_user_sessions_in_db(conn):
+    """Simulates user sessions server-side in one CALL; no interaction rows cross the network."""
+    print("Starting user simulation (server-side)...")
+    try:
+        if _SIMULATION_PROCEDURE_SQL is None:
+            raise FileNotFoundError("simulate_sessions.sql not found next to user_simulator.py")
+        with conn.cursor() as cur:
+            cur.execute(_SIMULATION_PROCEDURE_SQL)
+            cur.execute("SET LOCAL synchronous_commit = off;")
+            cur.execute("CALL simulate_sessions(%s, %s, %s);", (USER_IDS, MIN_SESSION_LENGTH, MAX_SESSION_LENGTH))
+            total_interactions_recorded = cur.fetchone()[0]
+        conn.commit()
+    except (FileNotFoundError, psycopg2.Error) as e:
+        print(f"Error running simulate_sessions: {e}")
+        conn.rollback()
+        return
     print(f"\nUser simulation completed. Total interactions recorded: {total_interactions_recorded}.")
 
 def main():
@@ -159,13 +359,20 @@ def main():
         return
 
     if not create_tables_if_not_exist(conn): # This will also create user_interactions table
-        conn.close()
+        release_db_connection(conn)
+        return
+
+    if SIMULATION_MODE == "sql":
+        # Image ids and navigation paths are read by the procedure itself
+        simulate_user_sessions_in_db(conn)
+        release_db_connection(conn)
+        print("User simulation process finished.")
         return
 
     all_image_ids = fetch_all_image_ids(conn)
     if not all_image_ids:
         print("Exiting: No image metadata found. Run ETL first.")
-        conn.close()
+        release_db_connection(conn)
         return
         
     nav_paths = fetch_navigation_paths(conn)
@@ -175,7 +382,7 @@ def main():
 
     simulate_user_sessions(conn, all_image_ids, nav_paths)
 
-    conn.close()
+    release_db_connection(conn)
     print("User simulation process finished.")
 
 if __name__ == "__main__":